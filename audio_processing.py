@@ -1,3 +1,6 @@
+import collections
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import scipy.signal
 
@@ -33,27 +36,69 @@ TRACK_PANNING = {
 }
 
 
+# Constant power panning lookup table: (gain_l, gain_r) for pan values in [-1, 1]
+# Pan value maps to angle [0, pi/2]; gain_l = cos(angle), gain_r = sin(angle)
+PAN_LUT_STEPS = 1024
+_pan_angles = np.linspace(0, np.pi / 2, PAN_LUT_STEPS + 1)
+_PAN_LUT = np.empty((PAN_LUT_STEPS + 1, 2), dtype=np.float32)
+_PAN_LUT[:, 0] = np.cos(_pan_angles)
+_PAN_LUT[:, 1] = np.sin(_pan_angles)
+
+
+def get_pan_gains(pan_value):
+    """Returns the constant power (gain_l, gain_r) pair for a pan value in [-1, 1]."""
+    idx = int(round((pan_value + 1.0) * (PAN_LUT_STEPS / 2)))
+    idx = max(0, min(PAN_LUT_STEPS, idx))
+    gain_l, gain_r = _PAN_LUT[idx]
+    return float(gain_l), float(gain_r)
+
+
 def apply_panning(audio_mono, pan_value):
     if not isinstance(audio_mono, np.ndarray) or audio_mono.ndim != 1:
         return np.zeros((len(audio_mono) if hasattr(audio_mono, '__len__') else 0, 2), dtype=np.float32)
 
-    # Constant power panning (approximated)
-    # angle = (pan_value * 0.5 + 0.5) * (np.pi / 2) # Map pan value from [-1, 1] to angle [0, pi/2]
-    # gain_l = np.cos(angle)
-    # gain_r = np.sin(angle)
-
-    # Simpler linear panning (easier to reason about, less "constant power")
-    gain_l = min(1.0, 1.0 - pan_value if pan_value > 0 else 1.0)
-    gain_r = min(1.0, 1.0 + pan_value if pan_value < 0 else 1.0)
+    gain_l, gain_r = get_pan_gains(pan_value)
 
-    stereo_signal = np.zeros((len(audio_mono), 2), dtype=np.float32)
-    stereo_signal[:, 0] = audio_mono * gain_l
-    stereo_signal[:, 1] = audio_mono * gain_r
+    # One broadcast multiply writes both channels as contiguous interleaved L/R frames,
+    # instead of two strided column writes into a C-contiguous (N, 2) buffer
+    gains = np.array([gain_l, gain_r], dtype=np.float32)
+    stereo_signal = audio_mono.astype(np.float32, copy=False)[:, None] * gains
 
     return stereo_signal
 
+
+def mix_add(master_stereo, audio_mono, gain_l, gain_r):
+    """
+    Pans a mono signal and adds it into a stereo (N, 2) buffer in one step,
+    without building an intermediate stereo copy of the signal.
+    master_stereo and audio_mono must have the same length (slice master to fit).
+    """
+    master_stereo[:, 0] += audio_mono * np.float32(gain_l)
+    master_stereo[:, 1] += audio_mono * np.float32(gain_r)
+
 # --- Auto-EQ (Placeholders / Basic Filters) ---
 
+HPF_CUTOFF_HZ = 90 # General high-pass cutoff for non-bass elements
+HPF_ORDER = 4
+HPF_BYPASS_TRACKS = ("Bassline", "Drums_Kick", "Pads") # Pads might have low freq content
+
+@functools.lru_cache(maxsize=8)
+def _hpf_sos(sample_rate):
+    # Cutoff and order are fixed, so the filter only needs designing once per sample rate.
+    # float32 coefficients keep sosfilt from upcasting float32 audio to float64.
+    return scipy.signal.butter(N=HPF_ORDER, Wn=HPF_CUTOFF_HZ, btype='highpass', fs=sample_rate, output='sos').astype(np.float32)
+
+# The app renders at one of these rates, so design their filters up front at import
+# rather than on the first render
+HPF_PRESET_SAMPLE_RATES = (44100, 48000)
+for _preset_rate in HPF_PRESET_SAMPLE_RATES:
+    _hpf_sos(_preset_rate)
+
+def _eq_bypassed(track_name, sample_rate):
+    """True if apply_eq_track leaves track_name's audio unchanged at this sample rate."""
+    # Avoid error if cutoff is too high for sample rate
+    return track_name in HPF_BYPASS_TRACKS or HPF_CUTOFF_HZ >= 0.5 * sample_rate
+
 def apply_eq_track(audio_data_mono, track_name, sample_rate):
     """
     Applies basic EQ to a mono track before panning.
@@ -61,17 +106,12 @@ def apply_eq_track(audio_data_mono, track_name, sample_rate):
     if not isinstance(audio_data_mono, np.ndarray) or audio_data_mono.ndim != 1 or audio_data_mono.size == 0:
         return audio_data_mono # Return unchanged if not suitable mono data
 
-    if track_name not in ["Bassline", "Drums_Kick", "Pads"]: # Pads might have low freq content
+    if not _eq_bypassed(track_name, sample_rate):
         try:
             # 4th order Butterworth high-pass filter
             # Cutoff frequency (e.g., 80-100Hz for general high-passing non-bass elements)
-            cutoff_hz = 90
-            nyquist = 0.5 * sample_rate
-            if cutoff_hz >= nyquist: # Avoid error if cutoff is too high for sample rate
-                return audio_data_mono
-
-            sos = scipy.signal.butter(N=4, Wn=cutoff_hz, btype='highpass', fs=sample_rate, output='sos')
-            filtered_audio = scipy.signal.sosfilt(sos, audio_data_mono)
+            sos = _hpf_sos(sample_rate)
+            filtered_audio = scipy.signal.sosfilt(sos, audio_data_mono.astype(np.float32, copy=False))
             return filtered_audio
         except Exception as e:
             print(f"Warning: Could not apply HPF to {track_name}: {e}")
@@ -91,38 +131,141 @@ def apply_eq_track(audio_data_mono, track_name, sample_rate):
     return audio_data_mono
 
 
+# --- Per-Track Processing ---
+
+def eq_track_spans(track_mono, track_name, sample_rate, active_spans=None):
+    """
+    Applies apply_eq_track in place to each (start, end) span of a mono track.
+    active_spans is an optional list of non-overlapping (start, end) sample ranges where the
+    track actually has sound; only those ranges are processed. Skipping the silence also keeps
+    the filter from decaying into denormal values, which makes sosfilt extremely slow.
+    The track is also returned for convenience.
+    """
+    if _eq_bypassed(track_name, sample_rate):
+        return track_mono # Nothing to filter, so don't copy each span back onto itself
+    if active_spans is None:
+        active_spans = [(0, len(track_mono))]
+    for span_start, span_end in active_spans:
+        track_mono[span_start:span_end] = apply_eq_track(track_mono[span_start:span_end], track_name, sample_rate)
+    return track_mono
+
+def pan_mix_track(track_mono, track_name, master_stereo, active_spans=None):
+    """Pans a mono track by its TRACK_PANNING value and adds its active spans into master_stereo."""
+    if active_spans is None:
+        active_spans = [(0, len(track_mono))]
+    pan_value = TRACK_PANNING.get(track_name, TRACK_PANNING["Default"])
+    gain_l, gain_r = get_pan_gains(pan_value)
+    for span_start, span_end in active_spans:
+        mix_add(master_stereo[span_start:span_end], track_mono[span_start:span_end], gain_l, gain_r)
+
+def render_mix(tracks, sample_rate, master_stereo, max_workers=2):
+    """
+    EQs, pans and mixes many mono tracks into master_stereo.
+    tracks is an iterable of (track_name, track_mono, active_spans) tuples, each with its own
+    mono buffer. It may be a generator: the next track is produced while earlier ones are being filtered.
+    The per-track EQ (eq_track_spans) runs on a thread pool (sosfilt and NumPy release the GIL), and the
+    pan+mix (pan_mix_track) is done on the calling thread, so the master buffer has a single writer.
+    Once more than max_workers tracks are pending, the oldest is mixed before the next track is pulled
+    from tracks, so only a few track buffers are alive at a time instead of all of them.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = collections.deque()
+        for track_name, track_mono, active_spans in tracks:
+            pending.append((track_name, active_spans,
+                            pool.submit(eq_track_spans, track_mono, track_name, sample_rate, active_spans)))
+            if len(pending) > max_workers:
+                track_name, active_spans, future = pending.popleft()
+                pan_mix_track(future.result(), track_name, master_stereo, active_spans)
+        while pending:
+            track_name, active_spans, future = pending.popleft()
+            pan_mix_track(future.result(), track_name, master_stereo, active_spans)
+
+
 # --- Auto-Mastering ---
 
-def apply_mastering_chain(stereo_audio_mix):
-    processed_mix = stereo_audio_mix.copy()
-    if processed_mix.size == 0: return processed_mix
+MASTER_TARGET_PEAK = np.float32(0.94) # Corresponds to approx -0.5 dBFS (20*log10(0.94))
+
+def _mastering_gain(stereo_audio_mix, target_peak=MASTER_TARGET_PEAK):
+    """
+    Returns the limiter gain for a mix, or None if the mix can be left untouched.
+    """
+    if stereo_audio_mix.size == 0: return None
 
     # 1. Basic Peak Normalization / Limiting
     # Normalize to a target peak level (e.g., -0.5 dBFS) to provide headroom and consistent output.
-    target_peak_amplitude = 0.94 # Corresponds to approx -0.5 dBFS (20*log10(0.94))
-
-    current_max_abs_val = np.max(np.abs(processed_mix))
+    # Peak from min/max reductions, which avoids allocating a full abs() buffer
+    current_max_abs_val = max(float(stereo_audio_mix.max()), -float(stereo_audio_mix.min()))
 
     if current_max_abs_val == 0: # Silence
-        return processed_mix
+        return None
 
-    if current_max_abs_val > target_peak_amplitude:
-        gain_to_apply = target_peak_amplitude / current_max_abs_val
-        processed_mix *= gain_to_apply
-    # If it's quieter than target_peak_amplitude, this simple version doesn't boost it.
+    if current_max_abs_val > target_peak:
+        return np.float32(target_peak / current_max_abs_val)
+    # If it's quieter than the target peak, this simple version doesn't boost it.
     # A true "mastering" chain might include upward compression or makeup gain.
 
     # 2. Optional: Very simple soft clipping as a safety net (if needed after normalization)
     # threshold = 0.98
     # processed_mix = threshold * np.tanh(processed_mix / threshold) if threshold > 0 else processed_mix
+    return None
+
+
+def apply_mastering_chain(stereo_audio_mix):
+    """
+    Peak-limits a stereo mix to MASTER_TARGET_PEAK.
+    The peak is measured first, and a scaled copy is only allocated when gain reduction is
+    needed; a mix that's already quiet enough is returned as-is (as float32).
+    """
+    processed_mix = np.asarray(stereo_audio_mix).astype(np.float32, copy=False)
+    gain_to_apply = _mastering_gain(processed_mix)
+    if gain_to_apply is None:
+        return processed_mix
+    return processed_mix * gain_to_apply
 
-    return processed_mix
+
+def apply_mastering_chain_inplace(stereo_audio_mix):
+    """
+    Same as apply_mastering_chain, but scales the given buffer in place instead of a copy.
+    Use when the mix buffer is disposable (e.g. the synthesizer's master buffer).
+    """
+    gain_to_apply = _mastering_gain(stereo_audio_mix)
+    if gain_to_apply is not None:
+        stereo_audio_mix *= gain_to_apply
+    return stereo_audio_mix
+
+
+INT16_SCALE = np.float32(32767.0)
+
+def to_int16_pcm(audio_data, scale=INT16_SCALE, out=None):
+    """
+    Converts float audio in [-1.0, 1.0] to int16 PCM. scale is the float-to-int16 factor;
+    a gain can be applied in the same pass by folding it into scale (see master_and_quantize).
+    Scaling, clipping and rounding all happen in place on a single float32 scratch
+    buffer, which is then cast into `out` (allocated here if not given).
+    """
+    scratch = np.multiply(audio_data, scale, dtype=np.float32)
+    np.clip(scratch, -32768.0, 32767.0, out=scratch)
+    np.rint(scratch, out=scratch)
+    if out is None:
+        out = np.empty(scratch.shape, dtype=np.int16)
+    out[...] = scratch
+    return out
+
+def master_and_quantize(stereo_audio_mix, target_peak=MASTER_TARGET_PEAK, out=None):
+    """
+    Applies the mastering gain and converts the mix to int16 PCM in a single pass:
+    the limiter gain is folded into the int16 scale passed to to_int16_pcm.
+    The result can be passed straight to exporter.save_wav_file / save_mp3_file.
+    """
+    gain_to_apply = _mastering_gain(stereo_audio_mix, target_peak)
+    scale = np.float32((1.0 if gain_to_apply is None else gain_to_apply) * 32767.0)
+    return to_int16_pcm(stereo_audio_mix, scale, out)
 
 
 if __name__ == "__main__":
     print("Audio Processing Module Test")
     sr = 44100
-    mono_sine = np.sin(np.linspace(0, 440 * 2 * np.pi * 1, sr, endpoint=False))
+    mono_sine = np.sin(np.linspace(0, 440 * 2 * np.pi * 1, sr, endpoint=False)).astype(np.float32)
 
     # Test Panning
     pan_left = apply_panning(mono_sine, -0.5)
@@ -148,11 +291,16 @@ if __name__ == "__main__":
     print(f"Mastered Quiet: L_max={np.max(mastered_quiet[:,0]):.2f}, R_max={np.max(mastered_quiet[:,1]):.2f}")
     # Quiet signal should remain quiet with this simple peak normalization
     assert np.allclose(np.max(np.abs(stereo_quiet)), np.max(np.abs(mastered_quiet))), "Quiet signal changed unexpectedly"
+
+    # Test fused mastering + int16 quantization
+    quantized_loud = master_and_quantize(stereo_loud)
+    print(f"Quantized Loud: dtype={quantized_loud.dtype}, max={np.max(np.abs(quantized_loud))}")
+    assert quantized_loud.dtype == np.int16 and np.max(np.abs(quantized_loud)) <= int(0.94 * 32767) + 1, "Quantized peak out of range"
     print("Audio processing tests passed (basic checks).")
 # ```
 # The file `audio_processing.py` now includes:
 # *   `TRACK_LEVELS` and `TRACK_PANNING` dictionaries.
-# *   `apply_panning(audio_mono, pan_value)`: Converts a mono signal to stereo and applies panning. I've used a slightly more standard linear panning logic.
+# *   `apply_panning(audio_mono, pan_value)`: Converts a mono signal to stereo and applies constant power panning (gains from a precomputed sin/cos table).
 # *   `apply_eq_track(audio_data_mono, track_name, sample_rate)`: Applies a 4th-order Butterworth high-pass filter (cutoff 90Hz) to non-bass/kick/pad tracks using `scipy.signal`. Error handling for invalid cutoff is included. Other EQs are still conceptual.
 # *   `apply_mastering_chain(stereo_audio_mix)`: Implements peak normalization to a target amplitude (approx -0.5 dBFS). This acts as a simple limiter by ensuring the output doesn't exceed this level. True compression or more advanced limiting is not yet included.
 # *   Basic tests in the `if __name__ == "__main__":` block.
@@ -1,11 +1,102 @@
+import os
+import struct
 import numpy as np
 import mido
 from scipy.io import wavfile
 import math
+import subprocess
+import threading
+import audio_processing # For converting float audio to int16 PCM
 
 # --- MIDI Export ---
 DEFAULT_TICKS_PER_BEAT = 480
 DEFAULT_MIDI_VELOCITY = 90 # Default velocity for notes if not specified otherwise by event
+# The MIDI file is normally written byte-for-byte by _write_smf_file, which skips building
+# a mido.Message per note. Set CHIPTUNE_MIDI_USE_MIDO=1 to go through mido instead.
+USE_MIDO_WRITER = os.environ.get("CHIPTUNE_MIDI_USE_MIDO", "") == "1"
+
+def _track_note_messages(events, bpm, ticks_per_beat):
+    """
+    Converts a track's note events into time-ordered MIDI note messages.
+    Returns parallel lists (delta_ticks, is_note_on, notes, velocities, channels).
+    """
+    # Sort events by start time just in case, though they should be somewhat sorted.
+    # The critical part is calculating delta times correctly.
+    sorted_events = sorted(events, key=lambda e: e.time_start)
+
+    # Robust MIDI event timing:
+    # 1. Compute absolute ticks for every note_on/note_off with vectorized NumPy math
+    note_events = [event for event in sorted_events if event.type == 'note']
+    num_notes = len(note_events)
+    if num_notes == 0:
+        return [], [], [], [], []
+
+    tick_scale = ticks_per_beat * (bpm / 60.0)
+    starts = np.fromiter((e.time_start for e in note_events), dtype=np.float64, count=num_notes)
+    durations = np.fromiter((e.duration for e in note_events), dtype=np.float64, count=num_notes)
+    notes = np.fromiter((e.note for e in note_events), dtype=np.int64, count=num_notes)
+    velocities = np.fromiter((e.velocity for e in note_events), dtype=np.int64, count=num_notes)
+    channels = np.fromiter((e.channel for e in note_events), dtype=np.int64, count=num_notes)
+
+    abs_on_ticks = np.rint(starts * tick_scale).astype(np.int64)
+    # Ensure note_off is not before note_on, and duration is at least 1 tick if very short
+    abs_off_ticks = np.maximum(np.rint((starts + durations) * tick_scale).astype(np.int64), abs_on_ticks + 1)
+
+    # Interleave as on0, off0, on1, off1, ... (the order the messages were generated in)
+    abs_ticks = np.empty(2 * num_notes, dtype=np.int64)
+    abs_ticks[0::2], abs_ticks[1::2] = abs_on_ticks, abs_off_ticks
+    is_note_on = np.tile(np.array([True, False]), num_notes)
+    msg_notes = np.repeat(notes, 2)
+    msg_velocities = np.repeat(velocities, 2)
+    msg_velocities[1::2] = 0 # Velocity 0 for note_off
+    msg_channels = np.repeat(channels, 2)
+
+    # 2. Stable sort by absolute tick, then by message type (note_off before note_on at same time)
+    # (e.g. end of one note, start of another)
+    order = np.lexsort((is_note_on, abs_ticks))
+    delta_ticks = np.maximum(np.diff(abs_ticks[order], prepend=0), 0) # Ensure non-negative delta
+
+    return (delta_ticks.tolist(), is_note_on[order].tolist(), msg_notes[order].tolist(),
+            msg_velocities[order].tolist(), msg_channels[order].tolist())
+
+def _write_varlen(data, value):
+    """Appends a non-negative int to the bytearray data as a MIDI variable-length quantity."""
+    if value < 0x80: # Most deltas fit in one byte
+        data.append(value)
+        return
+    encoded = [value & 0x7F]
+    value >>= 7
+    while value:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    data.extend(reversed(encoded))
+
+def _smf_track_chunk(track_name, messages):
+    """Builds an 'MTrk' chunk: track name, note messages (with running status), end of track."""
+    name_bytes = track_name.encode('latin-1', errors='replace')
+    data = bytearray(b'\x00\xff\x03')
+    _write_varlen(data, len(name_bytes))
+    data += name_bytes
+
+    running_status = None
+    for delta, on, note, velocity, channel in zip(*messages):
+        _write_varlen(data, delta)
+        status = (0x90 if on else 0x80) | channel
+        if status != running_status:
+            data.append(status)
+            running_status = status
+        data.append(note)
+        data.append(velocity)
+
+    data += b'\x00\xff\x2f\x00' # End of track
+    return b'MTrk' + struct.pack('>I', len(data)) + data
+
+def _write_smf_file(track_chunks, filepath, ticks_per_beat):
+    header = b'MThd' + struct.pack('>IHHH', 6, 1, len(track_chunks), ticks_per_beat) # Type 1 (multi-track) file
+    with open(filepath, 'wb') as midi_file:
+        midi_file.write(header)
+        for chunk in track_chunks:
+            midi_file.write(chunk)
 
 def save_midi_file(song_data, filepath, ticks_per_beat=DEFAULT_TICKS_PER_BEAT):
     """
@@ -15,111 +106,47 @@ def save_midi_file(song_data, filepath, ticks_per_beat=DEFAULT_TICKS_PER_BEAT):
     if not song_data:
         raise ValueError("No song data to export.")
 
-    mid = mido.MidiFile(ticks_per_beat=ticks_per_beat)
-
-    for track_name, events in song_data.tracks.items():
-        midi_track = mido.MidiTrack()
-        mid.tracks.append(midi_track)
-        midi_track.append(mido.MetaMessage('track_name', name=track_name, time=0))
-
-        # Sort events by start time just in case, though they should be somewhat sorted.
-        # The critical part is calculating delta times correctly.
-        sorted_events = sorted(events, key=lambda e: e.time_start)
-
-        last_event_abs_ticks = 0
-
-        for event in sorted_events:
-            if event.type == 'note':
-                abs_start_ticks = int(round(event.time_start * ticks_per_beat * (song_data.bpm / 60.0)))
-                abs_end_ticks = int(round((event.time_start + event.duration) * ticks_per_beat * (song_data.bpm / 60.0)))
-
-                # Note On message
-                delta_on = abs_start_ticks - last_event_abs_ticks
-                midi_track.append(mido.Message('note_on',
-                                               note=event.note,
-                                               velocity=event.velocity,
-                                               time=max(0, delta_on),  # Delta time must be non-negative
-                                               channel=event.channel))
-                last_event_abs_ticks = abs_start_ticks
-
-                # Note Off message - Mido handles sorting these if they are added to a list
-                # then processed, but easier to interleave if strict timing is needed.
-                # For simplicity here, we'll add note_off relative to the note_on's absolute time.
-                # This means we need a way to sort messages by absolute time before finalizing deltas,
-                # or ensure note_offs are also timed with deltas.
-                #
-                # Simpler: Calculate delta for note_off based on previous event (which was its note_on)
-                # No, this is wrong. Delta is always from the *previous message on this track*.
-                # A common way is to store (abs_time, message) tuples, sort them, then calculate deltas.
-
-                # Let's try the tuple storage method for robustness:
-                # This event processing logic needs to be outside the loop to collect all ons/offs first.
-                pass # Will be handled by a more robust approach below.
-
-        # Robust MIDI event timing:
-        # 1. Create a list of (absolute_tick, message_type, note, velocity, channel)
-        timed_midi_messages = []
-        for event in sorted_events: # Iterate again, this time for the robust list
-            if event.type == 'note':
-                abs_start_ticks = int(round(event.time_start * ticks_per_beat * (song_data.bpm / 60.0)))
-                abs_end_ticks = int(round((event.time_start + event.duration) * ticks_per_beat * (song_data.bpm / 60.0)))
-
-                timed_midi_messages.append(
-                    (abs_start_ticks, 'note_on', event.note, event.velocity, event.channel)
-                )
-                # Ensure note_off is not before note_on, and duration is at least 1 tick if very short
-                duration_ticks = abs_end_ticks - abs_start_ticks
-                if duration_ticks <=0 : duration_ticks = 1 # Minimum 1 tick duration for a note_off
-
-                timed_midi_messages.append(
-                    (abs_start_ticks + duration_ticks, 'note_off', event.note, 0, event.channel) # Velocity 0 for note_off
-                )
-
-        # 2. Sort this list by absolute_tick, then by message type (note_off before note_on at same time)
-        def sort_key(msg_tuple):
-            abs_time, msg_type = msg_tuple[0], msg_tuple[1]
-            # Process note_off before note_on if they occur at the exact same tick
-            # (e.g. end of one note, start of another)
-            type_priority = 0 if msg_type == 'note_off' else 1
-            return (abs_time, type_priority)
-
-        timed_midi_messages.sort(key=sort_key)
-
-        # 3. Iterate through sorted list, create Mido messages, and calculate delta times
-        last_abs_ticks_for_track = 0
-        for msg_info in timed_midi_messages:
-            abs_ticks, msg_type, note, velocity, channel = msg_info
-            delta_ticks = abs_ticks - last_abs_ticks_for_track
-
-            midi_track.append(mido.Message(msg_type,
-                                           note=note,
-                                           velocity=velocity,
-                                           time=max(0, delta_ticks), # Ensure non-negative delta
-                                           channel=channel))
-            last_abs_ticks_for_track = abs_ticks
-
-        # Add End of Track meta message
-        # It should have a delta time from the last event. If no events, time=0.
-        # For now, Mido might handle this, or we can add it with time=0 if last one was also 0.
-        # midi_track.append(mido.MetaMessage('end_of_track', time=...))
-        # Mido adds this automatically on save if not present.
-
-    mid.save(filepath)
+    if USE_MIDO_WRITER:
+        mid = mido.MidiFile(ticks_per_beat=ticks_per_beat)
+        for track_name, events in song_data.tracks.items():
+            midi_track = mido.MidiTrack()
+            mid.tracks.append(midi_track)
+            midi_track.append(mido.MetaMessage('track_name', name=track_name, time=0))
+            # 3. Create Mido messages from the sorted lists
+            for delta, on, note, velocity, channel in zip(*_track_note_messages(events, song_data.bpm, ticks_per_beat)):
+                midi_track.append(mido.Message('note_on' if on else 'note_off',
+                                               note=note, velocity=velocity, time=delta, channel=channel))
+            # Mido adds the end_of_track meta message automatically on save.
+        mid.save(filepath)
+    else:
+        # 3. Encode the sorted messages straight to Standard MIDI File bytes
+        track_chunks = [_smf_track_chunk(track_name, _track_note_messages(events, song_data.bpm, ticks_per_beat))
+                        for track_name, events in song_data.tracks.items()]
+        _write_smf_file(track_chunks, filepath, ticks_per_beat)
     print(f"MIDI file saved to {filepath}")
 
 
 # --- WAV Export ---
-def save_wav_file(audio_data_stereo, filepath, sample_rate):
+def save_wav_file(audio_data_stereo, filepath, sample_rate, already_normalized=False):
     """
     Saves the stereo audio data as a WAV file.
     Assumes audio_data_stereo is a NumPy array with shape (N, 2) and float32 dtype.
+    Pass already_normalized=True when the data is known to be within [-1.0, 1.0]
+    (e.g. straight out of the mastering chain) to skip the clipping step.
+    int16 data (e.g. from audio_processing.master_and_quantize) is written as-is as 16-bit PCM.
     """
     if not isinstance(audio_data_stereo, np.ndarray) or audio_data_stereo.ndim != 2 or audio_data_stereo.shape[1] != 2:
         raise ValueError("Audio data must be a stereo NumPy array (N, 2).")
+    if audio_data_stereo.dtype == np.int16:
+        wavfile.write(filepath, sample_rate, np.ascontiguousarray(audio_data_stereo))
+        print(f"WAV file saved to {filepath}")
+        return
+    owns_buffer = False # True once we're working on our own copy rather than the caller's array
     if audio_data_stereo.dtype != np.float32:
         # Attempt to convert if not float32, though this might indicate an issue upstream
         try:
             audio_data_stereo = audio_data_stereo.astype(np.float32)
+            owns_buffer = True
             print("Warning: WAV data was not float32, converted.")
         except:
             raise ValueError("Audio data for WAV export must be convertible to float32.")
@@ -127,12 +154,86 @@ def save_wav_file(audio_data_stereo, filepath, sample_rate):
     # Ensure data is within [-1.0, 1.0] if it's float.
     # scipy.io.wavfile.write handles scaling for int16, but for float32 it expects [-1,1]
     # Our mastering chain should already ensure this, but a clamp is safe.
-    audio_data_stereo = np.clip(audio_data_stereo, -1.0, 1.0)
-
+    # Clip without allocating: in place on our own copy, and not at all if already in range.
+    if not already_normalized and audio_data_stereo.size > 0:
+        if owns_buffer:
+            np.clip(audio_data_stereo, -1.0, 1.0, out=audio_data_stereo)
+        elif audio_data_stereo.max() > 1.0 or audio_data_stereo.min() < -1.0:
+            audio_data_stereo = np.clip(audio_data_stereo, -1.0, 1.0)
+
+    # wavfile.write streams float32 data straight from the array's buffer when it's
+    # C-contiguous; a strided view (e.g. a column slice) would be copied by ravel() first.
+    audio_data_stereo = np.ascontiguousarray(audio_data_stereo)
     wavfile.write(filepath, sample_rate, audio_data_stereo)
     print(f"WAV file saved to {filepath}")
 
 
+# --- MP3 Export ---
+DEFAULT_MP3_BITRATE = "192k"
+MP3_PIPE_CHUNK_FRAMES = 16384 # 64 KB of 16-bit stereo PCM per write to ffmpeg
+
+def save_mp3_file(audio_data_stereo, filepath, sample_rate, bitrate=DEFAULT_MP3_BITRATE, progress_callback=None):
+    """
+    Saves the stereo audio data as an MP3 file.
+    Raw 16-bit PCM is piped straight into an ffmpeg process, so no intermediate
+    WAV file or audio-library copy of the buffer is made.
+    Accepts float audio in [-1.0, 1.0] or int16 PCM (e.g. from audio_processing.master_and_quantize).
+    The PCM is written in MP3_PIPE_CHUNK_FRAMES chunks; if given, progress_callback(frames_written, total_frames)
+    is called after each one (from the calling thread).
+    Requires FFmpeg on the system PATH; raises RuntimeError if it can't be run.
+    """
+    if not isinstance(audio_data_stereo, np.ndarray) or audio_data_stereo.ndim != 2 or audio_data_stereo.shape[1] != 2:
+        raise ValueError("Audio data must be a stereo NumPy array (N, 2).")
+
+    # Interleaved, C-contiguous int16 frames, so the buffer can be piped to ffmpeg as-is
+    if audio_data_stereo.dtype == np.int16:
+        audio_data_int16 = np.ascontiguousarray(audio_data_stereo)
+    else:
+        audio_data_int16 = audio_processing.to_int16_pcm(audio_data_stereo)
+
+    ffmpeg_cmd = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 's16le', '-ar', str(sample_rate), '-ac', '2', '-i', 'pipe:0',
+        '-b:a', bitrate, filepath
+    ]
+    try:
+        proc = subprocess.Popen(ffmpeg_cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise RuntimeError("MP3 export requires FFmpeg. Please install FFmpeg and make sure it is on your system PATH.")
+
+    # ffmpeg's stderr is drained on a helper thread, so a chatty ffmpeg can't block on a full pipe
+    # while we're still writing its input
+    stderr_chunks = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+    stderr_reader.start()
+
+    total_frames = audio_data_int16.shape[0]
+    try:
+        for chunk_start in range(0, total_frames, MP3_PIPE_CHUNK_FRAMES):
+            chunk_end = min(chunk_start + MP3_PIPE_CHUNK_FRAMES, total_frames)
+            # A byte view of the chunk rather than tobytes(), which would copy it first
+            proc.stdin.write(memoryview(audio_data_int16[chunk_start:chunk_end].reshape(-1).view(np.uint8)))
+            if progress_callback is not None:
+                progress_callback(chunk_end, total_frames)
+    except BrokenPipeError:
+        pass # ffmpeg exited early; its error message is reported below
+    except BaseException:
+        # Anything else (e.g. raised by progress_callback) aborts the export; don't leave ffmpeg running
+        proc.kill()
+        raise
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        proc.wait()
+        stderr_reader.join()
+    if proc.returncode != 0:
+        stderr_output = b"".join(stderr_chunks)
+        raise RuntimeError(f"FFmpeg failed to encode MP3: {stderr_output.decode(errors='replace').strip()}")
+    print(f"MP3 file saved to {filepath}")
+
+
 if __name__ == '__main__':
     # Basic tests (conceptual, as they need a Song object and audio data)
     print("Exporter Module Basic Tests")
@@ -182,4 +283,10 @@ if __name__ == '__main__':
     except Exception as e:
         print(f"Test WAV export failed: {e}")
 
+    try:
+        save_mp3_file(mock_stereo_audio, "test_export.mp3", sample_rate_test)
+        print("Test MP3 export successful (file created: test_export.mp3).")
+    except Exception as e:
+        print(f"Test MP3 export failed: {e}")
+
     print("Exporter tests finished.")
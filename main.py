@@ -3,23 +3,65 @@ from tkinter import ttk, filedialog, messagebox # Added filedialog and messagebo
 import numpy as np # For audio data
 import sounddevice as sd
 import threading # To prevent GUI freezing during playback
+import random # For Randomize All
+from concurrent.futures import ThreadPoolExecutor # Song generation/rendering runs off the Tk thread
 
 # Import our other modules
 import song_generator
 import synthesizer
+import audio_processing # For quantizing the mix to playback PCM
 import music_theory # Potentially for key selection later
 import exporter # For saving files
 
+_FRAME_BYTES = 4 # One frame of playback audio: 2 channels of int16
+
+def _hex_to_rgb(color):
+    """Converts a "#RRGGBB" color string to an (r, g, b) tuple of ints."""
+    return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+def _rasterize_notes(frame, rects, colors_rgb, outline_rgb, x_offset):
+    """
+    Paints note rectangles into an RGB framebuffer, in order (later notes cover earlier ones).
+    rects is an (N, 4) int array of canvas pixel bounds (left, right, top, bottom), inclusive;
+    x_offset is the canvas x of the framebuffer's first column.
+    Each note is two slice fills, which beats a fully vectorized per-pixel scatter for the
+    note sizes a piano roll has.
+    """
+    if len(rects) == 0:
+        return
+    rects = rects - np.array([x_offset, x_offset, 0, 0])
+    for (left, right, top, bottom), rgb in zip(rects.tolist(), colors_rgb):
+        # max() keeps notes that start left of the framebuffer from wrapping around in the slice
+        frame[top:bottom + 1, max(left, 0):right + 1] = outline_rgb
+        frame[top + 1:bottom, max(left + 1, 0):right] = rgb
+
 class ProceduralSongGeneratorApp:
+    # Looked up once here rather than on every piano roll repaint
+    _C_PITCH_CLASS = music_theory.MIDI_TO_NOTE_NAME_SHARP.index("C")
+    _BAR_LEN = song_generator.BAR_LENGTH_BEATS
+
     def __init__(self, root):
         self.root = root
         self.root.title("Procedural Chiptune Song Generator")
         self.root.geometry("1200x800")
 
         self.current_song_data = None # To hold the generated song object
-        self.current_audio_data = None # To hold the rendered audio samples
+        self.current_audio_data = None # To hold the rendered audio samples, as int16 PCM (see _set_playback_audio)
+        self._total_frames = 0 # Length of current_audio_data in frames
+        self._playback_bytes = None # Byte view of current_audio_data (see _set_playback_audio)
+        # Per-section mixes reused across renders, see synthesizer.render_song_to_stereo_mix. Not thread-safe:
+        # only the generate worker and regenerate_section_action (which refuses while a song is generating) use it
+        self._section_audio_cache = {}
         self.playback_stream = None
         self.is_playing = False
+        self._playback_t0 = 0.0 # stream.time at which playback position 0 would have been heard
+        self._visualizer_after_id = None # Pending `after` job of the visualizer loop
+        self._tick_pending = False # True while a visualizer tick is queued with after_idle
+        # One worker, so a render never overlaps another render or shares the section cache with one
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._generate_future = None # Song generation job in flight, if any
+        self._export_futures = set() # Export jobs queued or running on the executor
+        self._closing = False # Set by _on_closing, so late worker callbacks don't touch the destroyed root
 
 
         # Configure dark theme
@@ -82,6 +124,9 @@ class ProceduralSongGeneratorApp:
         self.btn_stop = ttk.Button(gen_play_frame, text="Stop", command=self.stop_playback, state=tk.DISABLED)
         self.btn_stop.pack(side=tk.LEFT, padx=5, pady=5)
 
+        # Shown only while a song is being generated in the background
+        self.generate_progress = ttk.Progressbar(gen_play_frame, mode='indeterminate', length=100)
+
         # Mood selection (placeholder, will be improved)
         mood_frame = ttk.Frame(self.controls_frame)
         mood_frame.pack(side=tk.LEFT, padx=20)
@@ -97,23 +142,40 @@ class ProceduralSongGeneratorApp:
         bpm_frame.pack(side=tk.LEFT, padx=20)
         ttk.Label(bpm_frame, text="BPM:").pack(side=tk.LEFT)
         self.bpm_var = tk.IntVar(value=120)
-        self.bpm_scale = ttk.Scale(bpm_frame, from_=60, to_=180, variable=self.bpm_var, orient=tk.HORIZONTAL, command=lambda v: self.bpm_var.set(int(float(v))))
+        # Slider drags are coalesced into at most one BPM update per ~frame (see _on_bpm_scale)
+        self._pending_bpm = 120
+        self._bpm_after = None
+        self.bpm_scale = ttk.Scale(bpm_frame, from_=60, to_=180, variable=self.bpm_var, orient=tk.HORIZONTAL, command=self._on_bpm_scale)
         self.bpm_scale.pack(side=tk.LEFT, padx=5)
         self.lbl_bpm_value = ttk.Label(bpm_frame, text="120")
         self.lbl_bpm_value.pack(side=tk.LEFT)
-        self.bpm_var.trace_add("write", lambda *args: self.lbl_bpm_value.config(text=str(self.bpm_var.get())))
 
         # Export Controls
         export_frame = ttk.Frame(self.controls_frame)
         export_frame.pack(side=tk.LEFT, padx=30)
 
         ttk.Label(export_frame, text="Export:").pack(side=tk.LEFT, pady=5)
-        self.btn_export_midi = ttk.Button(export_frame, text="MIDI (.mid)", command=self.export_midi, state=tk.DISABLED)
+        self.btn_export_midi = ttk.Button(export_frame, text="MIDI (.mid)", command=lambda: self._do_export("midi"), state=tk.DISABLED)
         self.btn_export_midi.pack(side=tk.LEFT, padx=5, pady=5)
-        self.btn_export_wav = ttk.Button(export_frame, text="WAV (.wav)", command=self.export_wav, state=tk.DISABLED)
+        self.btn_export_wav = ttk.Button(export_frame, text="WAV (.wav)", command=lambda: self._do_export("wav"), state=tk.DISABLED)
         self.btn_export_wav.pack(side=tk.LEFT, padx=5, pady=5)
-        self.btn_export_mp3 = ttk.Button(export_frame, text="MP3 (.mp3)", command=self.export_mp3, state=tk.DISABLED)
+        self.btn_export_mp3 = ttk.Button(export_frame, text="MP3 (.mp3)", command=lambda: self._do_export("mp3"), state=tk.DISABLED)
         self.btn_export_mp3.pack(side=tk.LEFT, padx=5, pady=5)
+        # Shown only while a file is being exported in the background
+        self.export_progress = ttk.Progressbar(export_frame, mode='determinate', length=100, maximum=1.0)
+        self._export_fraction = 0.0 # Written by the export worker, read by _poll_export
+
+
+    def _on_bpm_scale(self, value):
+        """BPM slider callback: remembers the latest value and schedules a single commit for it."""
+        self._pending_bpm = int(float(value))
+        if self._bpm_after is None:
+            self._bpm_after = self.root.after(30, self._commit_bpm)
+
+    def _commit_bpm(self):
+        self._bpm_after = None
+        self.bpm_var.set(self._pending_bpm)
+        self.lbl_bpm_value.config(text=str(self._pending_bpm))
 
 
     def _setup_visualizer_placeholder(self):
@@ -130,7 +192,7 @@ class ProceduralSongGeneratorApp:
         self.midi_canvas = tk.Canvas(self.canvas_frame, bg="#1E1E1E", scrollregion=(0, 0, self.midi_canvas_width, self.midi_canvas_height))
 
         self.h_scrollbar = ttk.Scrollbar(self.canvas_frame, orient=tk.HORIZONTAL, command=self.midi_canvas.xview)
-        self.midi_canvas.configure(xscrollcommand=self.h_scrollbar.set)
+        self.midi_canvas.configure(xscrollcommand=self._on_canvas_xscroll)
 
         self.v_scrollbar = ttk.Scrollbar(self.canvas_frame, orient=tk.VERTICAL, command=self.midi_canvas.yview)
         self.midi_canvas.configure(yscrollcommand=self.v_scrollbar.set)
@@ -138,6 +200,13 @@ class ProceduralSongGeneratorApp:
         self.h_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
         self.v_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.midi_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.midi_canvas.bind("<Configure>", self._schedule_viewport_redraw)
+
+        # Only the part of the piano roll around the visible window is turned into canvas items
+        # (see _redraw_viewport); scrolling and resizing redraw it after a short debounce.
+        self.viewport_redraw_delay_ms = 50
+        self._viewport_redraw_job = None
+        self._drawn_x_range = None # (x0, x1) canvas range currently drawn
 
         # Define piano roll parameters
         self.note_height = 5  # Height of each note rectangle
@@ -153,6 +222,12 @@ class ProceduralSongGeneratorApp:
         self.midi_canvas_height = self.num_display_notes * self.note_height
         self.midi_canvas.config(scrollregion=(0, 0, self.midi_canvas_width, self.midi_canvas_height))
 
+        # Pixel rows of the pitch grid lines never change, so work them out once (C rows get the lighter color)
+        line_rows = np.arange(self.num_display_notes)
+        is_c_row = (self.max_display_midi - line_rows) % 12 == self._C_PITCH_CLASS
+        self._pitch_line_rows = line_rows[~is_c_row] * self.note_height
+        self._c_line_rows = line_rows[is_c_row] * self.note_height
+
         # Colors for different tracks (can be expanded)
         self.track_colors = {
             "Melody": "#FF6B6B", "Harmony Line": "#FFD166", "Counter-Melody": "#06D6A0",
@@ -161,9 +236,34 @@ class ProceduralSongGeneratorApp:
         }
         self.playing_note_color = "#FFFFFF" # White for currently playing note highlight
 
-        # Store drawn note items for updates (mapping event_id to canvas_item_id)
-        self.drawn_note_items = {} # Using (track_name, event_index) as key
+        self.canvas_bg_color = "#1E1E1E"
+        self.note_outline_color = "#333333"
+
+        # The idle piano roll (notes and grid) is rendered into one image per viewport redraw;
+        # only the highlighted notes are separate canvas rectangles drawn on top of it.
+        self.drawn_note_items = {} # Index into self._roll_notes -> canvas item id of the highlight rectangle
+        self._roll_image = None # Keeps the current tk.PhotoImage alive
+        self._roll_image_item = None # Canvas item showing _roll_image
+        self._roll_frame = None # RGB framebuffer of the drawn range (see _redraw_viewport)
         self.playhead_line = None
+        self.max_beat_time = 0
+
+        # Piano roll geometry of every displayable note, in drawing order (built in draw_all_midi_notes)
+        self._roll_x_starts = np.zeros(0, dtype=np.float32)
+        self._roll_x_ends = np.zeros(0, dtype=np.float32)
+        self._roll_notes = [] # ((track_name, event_index), x_start, note_width, y_pos, color) per note
+        self._roll_rects = np.zeros((0, 4), dtype=np.int64) # Pixel (left, right, top, bottom) per note
+        self._roll_rgb = np.zeros((0, 3), dtype=np.uint8) # Fill color per note
+
+        # Note highlight schedule, built in draw_all_midi_notes:
+        # note-ons sorted by start beat as (start_beat, end_beat, note_idx),
+        # note-offs sorted by end beat as (end_beat, note_idx), where note_idx indexes self._roll_notes
+        self._note_on_schedule = []
+        self._note_off_schedule = []
+        self._on_idx = 0
+        self._off_idx = 0
+        self._active_notes = set() # Indices of the currently highlighted notes
+        self._highlight_beat_time = 0.0
 
 
     def draw_all_midi_notes(self):
@@ -172,67 +272,230 @@ class ProceduralSongGeneratorApp:
 
         self.midi_canvas.delete("all") # Clear previous drawing
         self.drawn_note_items = {}
+        self._roll_image_item = None
 
-        max_beat_time = 0
-        if self.current_song_data and self.current_song_data.tracks:
-            for track_name, events in self.current_song_data.tracks.items():
-                for event in events:
-                    event_end_time = event.time_start + event.duration
-                    if event_end_time > max_beat_time:
-                        max_beat_time = event_end_time
+        self._build_roll_geometry()
+        self.midi_canvas.config(scrollregion=(0, 0, self.midi_canvas_width, self.midi_canvas_height))
+
+        # Create playhead line (initially off-screen or at start)
+        self.playhead_line = self.midi_canvas.create_line(0, 0, 0, self.midi_canvas_height, fill="red", width=2, tags="playhead")
+
+        self._drawn_x_range = None
+        self._redraw_viewport()
+
+    def _build_roll_geometry(self):
+        """
+        Computes the piano roll geometry and the highlight schedule for every displayable note of the
+        current song. Doesn't touch the canvas.
+        """
+        # Note geometry is computed per track with vectorized NumPy math on the song's cached
+        # arrays; the piano roll itself is only rendered for the visible window.
+        track_arrays = self.current_song_data.track_arrays
+        max_beat_time = self.current_song_data.notes_end_beat
+        self.max_beat_time = max_beat_time
 
         # Update canvas width based on total song duration
         self.midi_canvas_width = int(max_beat_time * self.pixels_per_beat) + int(2 * self.pixels_per_beat) # Add some padding
-        self.midi_canvas.config(scrollregion=(0, 0, self.midi_canvas_width, self.midi_canvas_height))
-
 
-        for track_idx, (track_name, events) in enumerate(self.current_song_data.tracks.items()):
+        x_starts, x_ends = [], []
+        roll_notes = []
+        note_on_schedule = []
+        for track_name, arrays in track_arrays.items():
             color = self.track_colors.get(track_name, self.track_colors["Default"])
-            for event_idx, event in enumerate(events):
-                if event.type == 'note':
-                    # Y position based on MIDI note value
-                    # Higher MIDI note = lower Y on canvas (top is 0)
-                    y_pos = (self.max_display_midi - event.note) * self.note_height
-
-                    # X position based on time_start
-                    x_start = event.time_start * self.pixels_per_beat
-
-                    # Width based on duration
-                    note_width = event.duration * self.pixels_per_beat
-
-                    if self.min_display_midi <= event.note <= self.max_display_midi :
-                        # Only draw notes within the displayable MIDI range
-                        item_id = self.midi_canvas.create_rectangle(
-                            x_start, y_pos,
-                            x_start + note_width, y_pos + self.note_height,
-                            fill=color, outline="#333333", tags=(track_name, f"note_{event_idx}")
-                        )
-                        self.drawn_note_items[(track_name, event_idx)] = item_id
-
-        # Draw horizontal lines for note pitches (like a piano roll background)
-        for i in range(self.num_display_notes):
-            y = i * self.note_height
-            line_color = "#303030" # Darker lines for C notes
-            midi_val = self.max_display_midi - i
-            if midi_val % 12 == music_theory.MIDI_TO_NOTE_NAME_SHARP.index("C"): # C notes
-                 line_color = "#454545"
-            self.midi_canvas.create_line(0, y, self.midi_canvas_width, y, fill=line_color, tags="grid_line")
-
-        # Draw vertical lines for beats/bars
-        num_total_beats = int(max_beat_time) +1
-        for beat in range(num_total_beats):
-            x = beat * self.pixels_per_beat
-            line_color = "#454545" # Bar lines
-            if beat % song_generator.BAR_LENGTH_BEATS != 0:
-                line_color = "#303030" # Beat lines
-            self.midi_canvas.create_line(x, 0, x, self.midi_canvas_height, fill=line_color, tags="grid_line")
-            if beat % song_generator.BAR_LENGTH_BEATS == 0: # Add bar numbers
-                self.midi_canvas.create_text(x + 2, 10, text=str(beat // song_generator.BAR_LENGTH_BEATS + 1), fill="#777777", anchor=tk.NW, font=("Arial", 8))
+            notes = arrays['n']
+            # X position based on time_start, width based on duration
+            xs = arrays['t'] * self.pixels_per_beat
+            ws = arrays['d'] * self.pixels_per_beat
+            # Y position based on MIDI note value
+            # Higher MIDI note = lower Y on canvas (top is 0)
+            ys = (self.max_display_midi - notes.astype(np.float32)) * self.note_height
+
+            # Only draw notes within the displayable MIDI range
+            visible = np.nonzero((notes >= self.min_display_midi) & (notes <= self.max_display_midi))[0]
+            x_starts.append(xs[visible])
+            x_ends.append((xs + ws)[visible])
+            starts = arrays['t'][visible].tolist()
+            ends = (arrays['t'] + arrays['d'])[visible].tolist()
+            for x_start, note_width, y_pos, event_idx, start_beat, end_beat in zip(
+                    xs[visible].tolist(), ws[visible].tolist(), ys[visible].tolist(),
+                    arrays['i'][visible].tolist(), starts, ends):
+                note_on_schedule.append((start_beat, end_beat, len(roll_notes)))
+                roll_notes.append(((track_name, event_idx), x_start, note_width, y_pos, color))
+
+        self._roll_x_starts = np.concatenate(x_starts) if x_starts else np.zeros(0, dtype=np.float32)
+        self._roll_x_ends = np.concatenate(x_ends) if x_ends else np.zeros(0, dtype=np.float32)
+        self._roll_notes = roll_notes
+
+        # Integer pixel bounds and RGB colors for the rasterizer, computed once per song
+        # instead of on every viewport redraw
+        rgb_by_color = {color: _hex_to_rgb(color) for color in set(note[4] for note in roll_notes)}
+        self._roll_rects = np.array([(x_start, x_start + note_width, y_pos, y_pos) for _, x_start, note_width, y_pos, _ in roll_notes],
+                                    dtype=np.float64).reshape(-1, 4)
+        self._roll_rects = np.rint(self._roll_rects).astype(np.int64)
+        self._roll_rects[:, 3] += self.note_height
+        self._roll_rgb = np.array([rgb_by_color[note[4]] for note in roll_notes], dtype=np.uint8).reshape(-1, 3)
+
+        # Highlighting walks these schedules with two cursors instead of polling every note
+        note_on_schedule.sort(key=lambda entry: entry[0])
+        self._note_on_schedule = note_on_schedule
+        self._note_off_schedule = sorted(((end_beat, note_idx) for _, end_beat, note_idx in note_on_schedule),
+                                         key=lambda entry: entry[0])
+        self._on_idx = 0
+        self._off_idx = 0
+        self._active_notes = set()
+        self._highlight_beat_time = 0.0
+
+    def redraw_section(self, section_idx):
+        """
+        Updates the piano roll after one section's notes were regenerated. Only the framebuffer
+        columns covered by the section's old and new notes are repainted; the canvas items stay as
+        they are. Falls back to draw_all_midi_notes if the song's length changed.
+        """
+        if not self.current_song_data or self._roll_frame is None or self._drawn_x_range is None:
+            self.draw_all_midi_notes()
+            return
 
-        # Create playhead line (initially off-screen or at start)
-        self.playhead_line = self.midi_canvas.create_line(0, 0, 0, self.midi_canvas_height, fill="red", width=2, tags="playhead")
+        section = self.current_song_data.section_details[section_idx]
+        section_x0 = section['start_beat'] * self.pixels_per_beat
+        section_x1 = (section['start_beat'] + section['duration_beats']) * self.pixels_per_beat
+
+        def section_notes_x_end():
+            # Notes starting in the section can ring past its end
+            in_section = (self._roll_x_starts >= section_x0) & (self._roll_x_starts < section_x1)
+            return float(self._roll_x_ends[in_section].max()) if in_section.any() else section_x1
+
+        old_x_end = section_notes_x_end()
+        old_canvas_width = self.midi_canvas_width
+        self._reset_note_highlights() # Note indices change when the geometry is rebuilt
+        self._build_roll_geometry()
+        if self.midi_canvas_width != old_canvas_width:
+            self.draw_all_midi_notes()
+            return
+
+        drawn_x0, drawn_x1 = self._drawn_x_range
+        repaint_x0 = max(section_x0, drawn_x0)
+        repaint_x1 = min(max(old_x_end, section_notes_x_end(), section_x1), drawn_x1)
+        if repaint_x1 < repaint_x0:
+            return # Section isn't in the drawn range; it's painted when scrolled into view
+        # A couple of pixels of slack covers rounding and the note outlines
+        col0 = max(0, int(np.floor(repaint_x0)) - drawn_x0 - 2)
+        col1 = min(self._roll_frame.shape[1], int(np.ceil(repaint_x1)) - drawn_x0 + 2)
+        self._paint_roll_columns(col0, col1)
+        self._update_roll_image()
+
+    def _on_canvas_xscroll(self, first, last):
+        """xscrollcommand for the piano roll: updates the scrollbar and schedules a viewport redraw."""
+        self.h_scrollbar.set(first, last)
+        self._schedule_viewport_redraw()
+
+    def _schedule_viewport_redraw(self, event=None):
+        """Debounces viewport redraws so a burst of scroll/resize events only redraws once."""
+        if self._viewport_redraw_job is not None:
+            self.midi_canvas.after_cancel(self._viewport_redraw_job)
+        self._viewport_redraw_job = self.midi_canvas.after(self.viewport_redraw_delay_ms, self._redraw_viewport)
+
+    def _redraw_viewport(self):
+        """
+        Re-renders the piano roll for the visible part of the canvas, plus one view width of margin
+        on either side so short scrolls don't need a redraw.
+        Notes and grid lines are painted into a NumPy RGB framebuffer and shown as a single image item,
+        instead of one canvas item per note/line; bar numbers and highlighted notes stay canvas items.
+        Everything drawn here is tagged "viewport" and replaced on the next redraw.
+        """
+        self._viewport_redraw_job = None
+        if not self.current_song_data or self.playhead_line is None:
+            return
+
+        view_x0 = self.midi_canvas.canvasx(0)
+        view_x1 = self.midi_canvas.canvasx(self.midi_canvas.winfo_width())
+        if self._drawn_x_range and self._drawn_x_range[0] <= view_x0 and view_x1 <= self._drawn_x_range[1]:
+            return # Still inside the drawn range
+
+        margin = view_x1 - view_x0
+        x0 = int(max(0, view_x0 - margin))
+        x1 = int(min(self.midi_canvas_width, view_x1 + margin))
+        img_width, img_height = max(1, x1 - x0), self.midi_canvas_height
+
+        self.midi_canvas.delete("viewport")
+        self.drawn_note_items = {}
+        self._roll_image_item = None
+
+        self._roll_frame = np.empty((img_height, img_width, 3), dtype=np.uint8)
+        self._drawn_x_range = (x0, x1)
+        self._paint_roll_columns(0, img_width)
+        self._update_roll_image()
+
+        pixels_per_beat, bar_len = self.pixels_per_beat, self._BAR_LEN
+        create_text = self.midi_canvas.create_text
+        num_total_beats = int(self.max_beat_time) +1
+        first_beat = max(0, int(np.ceil(x0 / pixels_per_beat)))
+        last_beat = min(num_total_beats - 1, int(x1 / pixels_per_beat))
+        beats = np.arange(first_beat, last_beat + 1)
+        is_bar = beats % bar_len == 0
+        for beat in beats[is_bar].tolist(): # Add bar numbers
+            x = beat * pixels_per_beat
+            create_text(x + 2, 10, text=str(beat // bar_len + 1), fill="#777777", anchor=tk.NW, font=("Arial", 8), tags="viewport")
+
+        for note_idx in self._active_notes:
+            self._draw_note_highlight(note_idx)
         self.midi_canvas.tag_raise("playhead") # Ensure it's on top of notes
 
+    def _paint_roll_columns(self, col0, col1):
+        """Repaints columns [col0, col1) of the piano roll framebuffer: background, notes and grid lines."""
+        frame = self._roll_frame[:, col0:col1]
+        x0 = self._drawn_x_range[0] + col0
+        x1 = x0 + frame.shape[1]
+        frame[:] = _hex_to_rgb(self.canvas_bg_color)
+
+        # Notes: outline-colored rectangle with the track color inside (same look as create_rectangle)
+        in_view = np.nonzero((self._roll_x_ends >= x0) & (self._roll_x_starts <= x1))[0]
+        _rasterize_notes(frame, self._roll_rects[in_view], self._roll_rgb[in_view],
+                         np.array(_hex_to_rgb(self.note_outline_color), dtype=np.uint8), x0)
+
+        # Horizontal lines for note pitches (like a piano roll background); lighter lines for C notes
+        frame[self._pitch_line_rows] = _hex_to_rgb("#303030")
+        frame[self._c_line_rows] = _hex_to_rgb("#454545")
+
+        # Vertical lines for beats/bars
+        num_total_beats = int(self.max_beat_time) +1
+        first_beat = max(0, int(np.ceil(x0 / self.pixels_per_beat)))
+        last_beat = min(num_total_beats - 1, int(x1 / self.pixels_per_beat))
+        beats = np.arange(first_beat, last_beat + 1)
+        beat_columns = np.rint(beats * self.pixels_per_beat).astype(np.int64) - x0
+        in_frame = (beat_columns >= 0) & (beat_columns < frame.shape[1])
+        is_bar = beats % self._BAR_LEN == 0
+        frame[:, beat_columns[in_frame & ~is_bar]] = _hex_to_rgb("#303030") # Beat lines
+        frame[:, beat_columns[in_frame & is_bar]] = _hex_to_rgb("#454545") # Bar lines
+
+    def _update_roll_image(self):
+        """Shows the current framebuffer on the canvas, reusing the existing photo image and image item where possible."""
+        img_height, img_width = self._roll_frame.shape[:2]
+        # Binary PPM is a format Tk's photo image reads natively, so no imaging library is needed
+        ppm_header = f"P6 {img_width} {img_height} 255\n".encode("ascii")
+        ppm_data = ppm_header + self._roll_frame.tobytes()
+        if self._roll_image is not None and (self._roll_image.width(), self._roll_image.height()) == (img_width, img_height):
+            self._roll_image.configure(data=ppm_data, format="PPM") # Reload the pixels into the existing image
+        else:
+            self._roll_image = tk.PhotoImage(data=ppm_data, format="PPM")
+        if self._roll_image_item is None:
+            self._roll_image_item = self.midi_canvas.create_image(self._drawn_x_range[0], 0, anchor=tk.NW, image=self._roll_image, tags="viewport")
+            self.midi_canvas.tag_lower(self._roll_image_item) # Keep bar numbers and highlights above the roll
+        else:
+            self.midi_canvas.itemconfig(self._roll_image_item, image=self._roll_image)
+
+    def _draw_note_highlight(self, note_idx):
+        """Draws the highlight rectangle for a note, if it lies within the currently drawn range."""
+        (track_name, event_idx), x_start, note_width, y_pos, _ = self._roll_notes[note_idx]
+        if self._drawn_x_range is None or x_start + note_width < self._drawn_x_range[0] or x_start > self._drawn_x_range[1]:
+            return
+        self.drawn_note_items[note_idx] = self.midi_canvas.create_rectangle(
+            x_start, y_pos,
+            x_start + note_width, y_pos + self.note_height,
+            fill=self.playing_note_color, outline=self.note_outline_color,
+            tags=(track_name, f"note_{event_idx}", "viewport")
+        )
+        self.midi_canvas.tag_raise("playhead")
+
 
     def update_playhead(self, current_beat_time):
         if self.playhead_line:
@@ -256,53 +519,77 @@ class ProceduralSongGeneratorApp:
             # Per-note highlighting will be added if performance allows or a better method is found.
 
     def _start_visualizer_update_loop(self):
-        if self.is_playing and self.current_song_data:
-            # Calculate current beat time based on sample position
-            current_time_seconds = self.current_sample_pos / synthesizer.SAMPLE_RATE
+        # Only one loop may be scheduled at a time, even if playback is restarted while a tick is queued
+        if self._visualizer_after_id is not None:
+            self.root.after_cancel(self._visualizer_after_id)
+            self._visualizer_after_id = None
+        self._tick_pending = False
+
+        if self.is_playing and self.current_song_data and self.playback_stream:
+            # Calculate current beat time from the stream's monotonic clock rather than
+            # the sample position the audio thread is updating
+            current_time_seconds = self.playback_stream.time - self._playback_t0
             current_beat_time = (current_time_seconds * self.current_song_data.bpm) / 60.0
 
             self.update_playhead(current_beat_time)
 
             # Highlight notes that are currently "on"
-            # This is a simplified approach. For precise highlighting, we'd track note on/off events.
-            # We need to iterate through self.drawn_note_items and check their timing against current_beat_time
-
-            active_notes_this_frame = [] # Store (track_name, event_idx) of active notes
-
-            for (track_name, event_idx), item_id in self.drawn_note_items.items():
-                try:
-                    event = self.current_song_data.tracks[track_name][event_idx]
-                    is_active = (event.time_start <= current_beat_time < (event.time_start + event.duration))
-
-                    original_color = self.track_colors.get(track_name, self.track_colors["Default"])
-                    current_color = self.midi_canvas.itemcget(item_id, "fill")
-
-                    if is_active:
-                        active_notes_this_frame.append((track_name, event_idx))
-                        if current_color != self.playing_note_color:
-                             self.midi_canvas.itemconfig(item_id, fill=self.playing_note_color)
-                    else:
-                        if current_color == self.playing_note_color: # Was highlighted, now turn off
-                            self.midi_canvas.itemconfig(item_id, fill=original_color)
+            self._advance_note_highlights(current_beat_time)
 
-                except (IndexError, KeyError) as e:
-                    # print(f"Error accessing event for highlighting: {track_name}, {event_idx} - {e}")
-                    pass # Event might not exist if song structure changes, or bad index
+            self._visualizer_after_id = self.root.after(33, self._request_visualizer_tick) # Approx 30 FPS update for playhead
 
-            # Reset color for notes that were active last frame but not this one
-            # This is covered by the else clause above now.
+    def _request_visualizer_tick(self):
+        """Queues the next visualizer tick for when the GUI is idle, coalescing ticks if the GUI falls behind."""
+        self._visualizer_after_id = None
+        if self._tick_pending:
+            return
+        self._tick_pending = True
+        self.root.after_idle(self._start_visualizer_update_loop)
 
-            self.root.after(30, self._start_visualizer_update_loop) # Approx 30 FPS update for playhead
+    def _advance_note_highlights(self, current_beat_time):
+        """
+        Moves the note-on/note-off cursors up to current_beat_time, touching only the notes
+        whose highlight state changes since the last frame.
+        Notes outside the drawn viewport just have their state tracked; _redraw_viewport
+        draws them highlighted if they come into view while active.
+        """
+        if current_beat_time < self._highlight_beat_time: # Playback restarted from an earlier position
+            self._reset_note_highlights()
+        self._highlight_beat_time = current_beat_time
+
+        on_schedule = self._note_on_schedule
+        while self._on_idx < len(on_schedule) and on_schedule[self._on_idx][0] <= current_beat_time:
+            _, end_beat, note_idx = on_schedule[self._on_idx]
+            self._on_idx += 1
+            if end_beat > current_beat_time: # Skip notes that already ended between frames
+                self._active_notes.add(note_idx)
+                self._draw_note_highlight(note_idx)
+
+        off_schedule = self._note_off_schedule
+        while self._off_idx < len(off_schedule) and off_schedule[self._off_idx][0] <= current_beat_time:
+            _, note_idx = off_schedule[self._off_idx]
+            self._off_idx += 1
+            self._active_notes.discard(note_idx)
+            item_id = self.drawn_note_items.pop(note_idx, None)
+            if item_id is not None:
+                self.midi_canvas.delete(item_id) # Reveals the note's normal color in the roll image
+
+    def _reset_note_highlights(self):
+        """Removes every note highlight and rewinds the schedule cursors."""
+        if self.drawn_note_items: # Usually only a handful, removed with one canvas call
+            self.midi_canvas.delete(*self.drawn_note_items.values())
+            self.drawn_note_items.clear()
+        self._active_notes.clear()
+        self._on_idx = 0
+        self._off_idx = 0
+        self._highlight_beat_time = 0.0
 
     def _stop_visualizer_update_loop(self):
         # This function isn't strictly necessary if the loop self-terminates
         # when self.is_playing is False, but can be called explicitly.
         # The loop condition `if self.is_playing` handles stopping.
         # Reset all highlighted notes to original color when stopping playback
-        if self.current_song_data and self.drawn_note_items:
-             for (track_name, event_idx), item_id in self.drawn_note_items.items():
-                original_color = self.track_colors.get(track_name, self.track_colors["Default"])
-                self.midi_canvas.itemconfig(item_id, fill=original_color) # Reset color
+        self._reset_note_highlights()
 
 
     def _setup_structure_editor_placeholder(self):
@@ -367,6 +654,13 @@ class ProceduralSongGeneratorApp:
             menu.grab_release()
 
     def regenerate_section_action(self, section_index_to_regenerate):
+        if self._generate_future is not None:
+            print("Cannot regenerate: a new song is still being generated.")
+            return
+        if self._export_futures:
+            # Regenerating splices events into the song's tracks in place, which a MIDI export may be reading
+            print("Cannot regenerate: the song is still being exported.")
+            return
         if not self.current_song_data or section_index_to_regenerate >= len(self.current_song_data.section_details):
             print("Cannot regenerate: No song data or invalid section index.")
             return
@@ -396,11 +690,12 @@ class ProceduralSongGeneratorApp:
 
         print(f"Section {section_index_to_regenerate} ({section_to_regen_name}) events regenerated by song_generator.")
         print("Re-rendering audio and updating visualizer...")
-        self.current_audio_data = synthesizer.render_song_to_stereo_mix(
+        self._set_playback_audio(synthesizer.render_song_to_stereo_mix(
             self.current_song_data,
-            sample_rate=synthesizer.SAMPLE_RATE
-        )
-        self.draw_all_midi_notes()
+            sample_rate=synthesizer.SAMPLE_RATE,
+            section_cache=self._section_audio_cache
+        ))
+        self.redraw_section(section_index_to_regenerate)
 
         can_play = self.current_audio_data is not None and len(self.current_audio_data) > 0
         self.btn_play_pause.config(state=tk.NORMAL if can_play else tk.DISABLED)
@@ -415,45 +710,87 @@ class ProceduralSongGeneratorApp:
         or "Randomize All" buttons.
         If mood or bpm are None, they are taken from UI controls.
         """
-        original_button_text_gen = self.btn_generate_full_song.cget("text")
-        original_button_text_rand = self.btn_randomize_all.cget("text")
-        self.btn_generate_full_song.config(state=tk.DISABLED, text="Generating...")
-        self.btn_randomize_all.config(state=tk.DISABLED, text="Generating...")
-        self.root.update_idletasks()
+        if self._generate_future is not None: # Already generating
+            return
+        self.btn_generate_full_song.config(state=tk.DISABLED)
+        self.btn_randomize_all.config(state=tk.DISABLED)
+        self.generate_progress.pack(side=tk.LEFT, padx=5, pady=5)
+        self.generate_progress.start(15)
 
-        if self.playback_stream and self.is_playing:
+        # The new song's audio replaces the buffers the stream reads from, so playback (even paused)
+        # is stopped, and Play/Stop stay disabled until _on_generate_done has swapped them
+        if self.playback_stream:
             self.stop_playback()
             sd.wait()
+        self.btn_play_pause.config(state=tk.DISABLED)
+        self.btn_stop.config(state=tk.DISABLED)
 
         selected_mood = mood if mood is not None else self.mood_var.get()
         selected_bpm = bpm if bpm is not None else self.bpm_var.get()
 
         # Update UI if parameters were chosen randomly
         if mood is not None: self.mood_var.set(selected_mood)
-        if bpm is not None: self.bpm_var.set(selected_bpm)
+        if bpm is not None:
+            self.bpm_var.set(selected_bpm)
+            self.lbl_bpm_value.config(text=str(selected_bpm))
 
         print(f"Generating song: Mood={selected_mood}, BPM={selected_bpm}, Key={key_root_name}{key_octave}")
-        self.current_song_data = song_generator.generate_full_song(
-            mood=selected_mood,
+        # Generation and rendering run on the worker thread so the GUI stays responsive;
+        # the result is handed back to the Tk thread with root.after
+        self._generate_future = self._executor.submit(
+            self._generate_song_worker, selected_mood, selected_bpm, key_root_name, key_octave)
+        self._generate_future.add_done_callback(
+            lambda future: self._after_from_worker(self._on_generate_done, future, auto_play))
+
+    def _after_from_worker(self, callback, *args):
+        """root.after(0, ...) for worker threads; does nothing once the window is closing."""
+        if self._closing: return
+        try:
+            self.root.after(0, callback, *args)
+        except (tk.TclError, RuntimeError): # The root was destroyed after the check above
+            pass
+
+    def _generate_song_worker(self, mood, bpm, key_root_name, key_octave):
+        """Runs on the executor thread: generates a song and renders it. Must not touch any widgets."""
+        song_data = song_generator.generate_full_song(
+            mood=mood,
             key_root_name=key_root_name,
             key_octave=key_octave,
-            bpm=selected_bpm
+            bpm=bpm
         )
         print("Song generation complete. Rendering to audio...")
-        self.current_audio_data = synthesizer.render_song_to_stereo_mix(
-            self.current_song_data,
-            sample_rate=synthesizer.SAMPLE_RATE
+        audio_data = synthesizer.render_song_to_stereo_mix(
+            song_data,
+            sample_rate=synthesizer.SAMPLE_RATE,
+            section_cache=self._section_audio_cache
         )
+        return song_data, audio_data
+
+    def _on_generate_done(self, future, auto_play):
+        """Back on the Tk thread: installs the generated song and updates the GUI."""
+        self._generate_future = None
+        self.generate_progress.stop()
+        self.generate_progress.pack_forget()
+        self.btn_generate_full_song.config(state=tk.NORMAL)
+        self.btn_randomize_all.config(state=tk.NORMAL)
+
+        try:
+            self.current_song_data, audio_data = future.result()
+        except Exception as e:
+            print(f"Error during song generation: {e}")
+            # The previous song is still loaded, so it can be played again
+            can_play = self.current_audio_data is not None and len(self.current_audio_data) > 0
+            self.btn_play_pause.config(state=tk.NORMAL if can_play else tk.DISABLED)
+            self.btn_stop.config(state=tk.NORMAL if can_play else tk.DISABLED)
+            tk.messagebox.showerror("Error", f"An error occurred during song generation: {e}")
+            return
+        self._set_playback_audio(audio_data)
         print(f"Audio rendering complete. Shape: {self.current_audio_data.shape}")
 
         self.draw_all_midi_notes()
         if self.current_song_data and self.current_song_data.section_details: # Update structure display
             self.display_song_structure([details['name'] for details in self.current_song_data.section_details])
 
-
-        self.btn_generate_full_song.config(state=tk.NORMAL, text=original_button_text_gen)
-        self.btn_randomize_all.config(state=tk.NORMAL, text=original_button_text_rand)
-
         if self.current_audio_data is not None and len(self.current_audio_data) > 0:
             self.btn_play_pause.config(state=tk.NORMAL)
             self.btn_stop.config(state=tk.NORMAL)
@@ -484,48 +821,6 @@ class ProceduralSongGeneratorApp:
 
         self.generate_full_song_action(mood=random_mood, bpm=random_bpm, auto_play=True)
 
-    # def generate_and_play_song(self): # This is the original method name, now refactored into generate_full_song_action
-    #     self.btn_generate_full_song.config(state=tk.DISABLED, text="Generating...") # Corrected button name
-    #     self.root.update_idletasks() # Update GUI before blocking task
-
-    #     # Stop any existing playback before generating a new song
-        if self.playback_stream and self.is_playing:
-            self.stop_playback()
-            # Wait for stream to properly stop if it was playing in a thread
-            # This might need more robust handling like joining the thread or using events
-            sd.wait()
-
-        selected_mood = self.mood_var.get()
-        selected_bpm = self.bpm_var.get()
-        # Key selection will be added later, default C4 for now
-
-        print(f"Generating song: Mood={selected_mood}, BPM={selected_bpm}")
-        self.current_song_data = song_generator.generate_full_song(
-            mood=selected_mood,
-            key_root_name="C", # Default for now
-            key_octave=4,      # Default for now
-            bpm=selected_bpm
-        )
-        print("Song generation complete. Rendering to audio...")
-        self.current_audio_data = synthesizer.render_song_to_stereo_mix(
-            self.current_song_data,
-            sample_rate=synthesizer.SAMPLE_RATE
-        )
-        print(f"Audio rendering complete. Shape: {self.current_audio_data.shape}")
-
-        self.draw_all_midi_notes() # Draw the notes on the canvas
-
-        self.btn_generate_play.config(state=tk.NORMAL, text="Generate & Play")
-
-        if self.current_audio_data is not None and len(self.current_audio_data) > 0:
-            self.btn_play_pause.config(state=tk.NORMAL)
-            self.btn_stop.config(state=tk.NORMAL)
-            self.play_audio() # Auto-play after generation
-        else:
-            print("No audio data generated.")
-            self.btn_play_pause.config(state=tk.DISABLED)
-            self.btn_stop.config(state=tk.DISABLED)
-
     def play_audio(self):
         if self.current_audio_data is None or len(self.current_audio_data) == 0:
             print("No audio data to play.")
@@ -543,14 +838,19 @@ class ProceduralSongGeneratorApp:
                 self.playback_stream.close(ignore_errors=True)
                 self.playback_stream = None
 
-            self.playback_stream = sd.OutputStream(
+            # A raw stream hands the callback PortAudio's buffer as-is instead of wrapping it in a
+            # NumPy array on every period; the callback just copies bytes into it
+            self.playback_stream = sd.RawOutputStream(
                 samplerate=synthesizer.SAMPLE_RATE,
                 channels=2, # Stereo audio now
-                dtype='float32',
-                callback=self._audio_callback
+                dtype='int16', # current_audio_data is already 16-bit PCM, so PortAudio needn't convert
+                latency='low', # Play/pause respond sooner; the callback is a single memcpy, so it keeps up
+                callback=self._audio_callback,
+                finished_callback=self._on_stream_finished
             )
             self.current_sample_pos = 0 # Reset position for new playback
             self.playback_stream.start()
+            self._playback_t0 = self.playback_stream.time
             self.is_playing = True
             self.btn_play_pause.config(text="Pause")
             print("Playback started.")
@@ -565,12 +865,25 @@ class ProceduralSongGeneratorApp:
             self.btn_play_pause.config(text="Play", state=tk.NORMAL if self.current_audio_data is not None else tk.DISABLED)
 
 
+    def _set_playback_audio(self, audio_data):
+        """
+        Stores rendered audio for playback, preconditioned once as a C-contiguous int16 (N, 2) array
+        so the realtime audio callback never has to convert or gather strided data.
+        The float mix isn't kept: at half the size, the int16 PCM also serves the WAV/MP3 exports.
+        """
+        assert audio_data.ndim == 2 and audio_data.shape[1] == 2, "Playback audio must be stereo (N, 2)"
+        # The mix is already mastered, so this is just the int16 scaling (plus clipping as a safety net)
+        self.current_audio_data = audio_processing.master_and_quantize(audio_data)
+        self._total_frames = self.current_audio_data.shape[0] # Cached for _audio_callback
+        # Flat byte view of the same buffer, for copying into the raw stream's output buffer
+        self._playback_bytes = memoryview(self.current_audio_data.reshape(-1).view(np.uint8))
+
     def _audio_callback(self, outdata, frames, time, status):
         if status:
             print(status, flush=True) # Print any errors from sounddevice
 
         if self.current_audio_data is None or not self.is_playing:
-            outdata[:] = 0 # Output silence
+            outdata[:] = bytes(len(outdata)) # Output silence
             # If playback is stopped externally, this might not be enough to stop the stream immediately
             # Raising sd.CallbackStop() is cleaner
             if not self.is_playing and self.playback_stream: # Ensure this check is robust
@@ -578,23 +891,29 @@ class ProceduralSongGeneratorApp:
                  raise sd.CallbackStop
             return
 
-        chunk_end = self.current_sample_pos + frames
-        if chunk_end > self.current_audio_data.shape[0]: # current_audio_data is now stereo (N, 2)
-            # Reached end of audio data
-            remaining_frames = self.current_audio_data.shape[0] - self.current_sample_pos
-            if remaining_frames > 0:
-                outdata[:remaining_frames] = self.current_audio_data[self.current_sample_pos : self.current_sample_pos + remaining_frames]
-            if frames > remaining_frames: # If outdata is larger than remaining audio
-                 outdata[remaining_frames:] = 0 # Fill rest with silence
+        # outdata is the raw stream's interleaved int16 buffer, the same layout as current_audio_data
+        # (see _set_playback_audio), so filling it is a plain byte copy out of _playback_bytes.
+        # The position is read into a local once and written back once.
+        pos = self.current_sample_pos
+        copy_frames = max(0, min(frames, self._total_frames - pos)) # Fewer than frames only at the end of the song
+        copy_bytes = copy_frames * _FRAME_BYTES
+        start_byte = pos * _FRAME_BYTES
+        outdata[:copy_bytes] = self._playback_bytes[start_byte:start_byte + copy_bytes]
+        self.current_sample_pos = pos + copy_frames
 
-            self.current_sample_pos += remaining_frames # Move to end
+        if copy_frames < frames: # Reached end of audio data
+            outdata[copy_bytes:] = bytes(len(outdata) - copy_bytes) # Fill rest with silence
+            raise sd.CallbackStop # _on_stream_finished reports the end of the song
 
-            self.root.after(0, self._playback_finished)
-            raise sd.CallbackStop
-        else:
-            outdata[:] = self.current_audio_data[self.current_sample_pos : chunk_end]
-            self.current_sample_pos = chunk_end
 
+    def _on_stream_finished(self):
+        """
+        sounddevice finished_callback, called from PortAudio's thread whenever the stream stops.
+        Pausing stops the stream too, so only the end of the audio is handed to the GUI thread;
+        stop_playback updates the GUI itself.
+        """
+        if self.current_audio_data is not None and self.current_sample_pos >= self._total_frames:
+            self.root.after(0, self._playback_finished)
 
     def _playback_finished(self):
         """Called when audio naturally reaches its end or is stopped."""
@@ -630,6 +949,7 @@ class ProceduralSongGeneratorApp:
                 try:
                     # self.current_sample_pos is maintained from where it paused
                     self.playback_stream.start()
+                    self._playback_t0 = self.playback_stream.time - self.current_sample_pos / synthesizer.SAMPLE_RATE
                     self.is_playing = True
                     self.btn_play_pause.config(text="Pause")
                     self._start_visualizer_update_loop() # Restart visualizer updates
@@ -658,7 +978,9 @@ class ProceduralSongGeneratorApp:
 
     def _on_closing(self):
         print("Application closing...")
+        self._closing = True
         self.stop_playback()
+        self._executor.shutdown(wait=False, cancel_futures=True)
         # Wait for sounddevice to clean up if necessary
         # sd.wait(timeout=100) # Timeout in ms, may not be needed if stream closed properly
         self.root.destroy()
@@ -673,63 +995,73 @@ class ProceduralSongGeneratorApp:
         self.btn_export_mp3.config(state=tk.NORMAL if has_audio_data else tk.DISABLED)
 
 
-    def export_midi(self):
-        if not self.current_song_data:
-            tk.messagebox.showwarning("Export Error", "No song data to export. Please generate a song first.")
-            return
+    def _do_export(self, kind):
+        """
+        Asks for a file name and exports the current song as kind ("midi", "wav" or "mp3", see _EXPORT_SPECS).
+        The file is written on the worker thread; the GUI polls its progress instead of blocking on it.
+        """
+        spec = _EXPORT_SPECS[kind]
+        if spec["needs_audio"]:
+            data = self.current_audio_data
+            if data is None or len(data) == 0:
+                tk.messagebox.showwarning("Export Error", "No audio data to export. Please generate and render a song first.")
+                return
+        else:
+            data = self.current_song_data
+            if not data:
+                tk.messagebox.showwarning("Export Error", "No song data to export. Please generate a song first.")
+                return
 
         filepath = tk.filedialog.asksaveasfilename(
-            defaultextension=".mid",
-            filetypes=[("MIDI Files", "*.mid"), ("All Files", "*.*")],
-            title="Save MIDI File"
+            defaultextension=spec["extension"],
+            filetypes=[(f"{spec['label']} Files", f"*{spec['extension']}"), ("All Files", "*.*")],
+            title=f"Save {spec['label']} File"
         )
         if not filepath: return # User cancelled
 
-        try:
-            exporter.save_midi_file(self.current_song_data, filepath)
-            tk.messagebox.showinfo("Export Successful", f"MIDI file saved to:\n{filepath}")
-        except Exception as e:
-            tk.messagebox.showerror("Export Error", f"Failed to export MIDI: {e}")
-
-
-    def export_wav(self):
-        if self.current_audio_data is None or len(self.current_audio_data) == 0:
-            tk.messagebox.showwarning("Export Error", "No audio data to export. Please generate and render a song first.")
-            return
-
-        filepath = tk.filedialog.asksaveasfilename(
-            defaultextension=".wav",
-            filetypes=[("WAV Files", "*.wav"), ("All Files", "*.*")],
-            title="Save WAV File"
-        )
-        if not filepath: return
-
-        try:
-            exporter.save_wav_file(self.current_audio_data, filepath, synthesizer.SAMPLE_RATE)
-            tk.messagebox.showinfo("Export Successful", f"WAV file saved to:\n{filepath}")
-        except Exception as e:
-            tk.messagebox.showerror("Export Error", f"Failed to export WAV: {e}")
-
-
-    def export_mp3(self):
-        if self.current_audio_data is None or len(self.current_audio_data) == 0:
-            tk.messagebox.showwarning("Export Error", "No audio data to export. Please generate and render a song first.")
+        self._export_fraction = 0.0
+        getattr(self, spec["button"]).config(state=tk.DISABLED)
+        self.export_progress.config(value=0.0)
+        self.export_progress.pack(side=tk.LEFT, padx=5, pady=5)
+        future = self._executor.submit(spec["save"], data, filepath, self._on_export_progress)
+        self._export_futures.add(future)
+        self.root.after(50, self._poll_export, future, spec, filepath)
+
+    def _on_export_progress(self, frames_written, total_frames):
+        """Progress callback for the exporters; runs on the worker thread, so it only records the fraction."""
+        self._export_fraction = frames_written / total_frames
+
+    def _poll_export(self, future, spec, filepath):
+        """Updates the export progress bar until the export finishes, then reports the result."""
+        self.export_progress.config(value=1.0 if future.done() else self._export_fraction)
+        if not future.done():
+            self.root.after(50, self._poll_export, future, spec, filepath)
             return
 
-        filepath = tk.filedialog.asksaveasfilename(
-            defaultextension=".mp3",
-            filetypes=[("MP3 Files", "*.mp3"), ("All Files", "*.*")],
-            title="Save MP3 File"
-        )
-        if not filepath: return
-
+        self._export_futures.discard(future)
+        self.export_progress.pack_forget()
+        self._update_export_buttons_state()
         try:
-            exporter.save_mp3_file(self.current_audio_data, filepath, synthesizer.SAMPLE_RATE)
-            tk.messagebox.showinfo("Export Successful", f"MP3 file saved to:\n{filepath}")
-        except RuntimeError as e: # Catch specific RuntimeError from pydub for ffmpeg issue
+            future.result()
+            tk.messagebox.showinfo("Export Successful", f"{spec['label']} file saved to:\n{filepath}")
+        except RuntimeError as e: # Raised by the exporter e.g. when FFmpeg is missing or fails
             tk.messagebox.showerror("Export Error", str(e)) # Show the detailed message from exporter
         except Exception as e:
-            tk.messagebox.showerror("Export Error", f"Failed to export MP3: {e}")
+            tk.messagebox.showerror("Export Error", f"Failed to export {spec['label']}: {e}")
+
+
+# How each export format is saved: the song data (MIDI) or the int16 playback audio (WAV/MP3) is
+# passed to "save" along with the file path and a progress callback, on the worker thread
+_EXPORT_SPECS = {
+    "midi": {"label": "MIDI", "extension": ".mid", "button": "btn_export_midi", "needs_audio": False,
+             "save": lambda song_data, filepath, progress_callback: exporter.save_midi_file(song_data, filepath)},
+    "wav": {"label": "WAV", "extension": ".wav", "button": "btn_export_wav", "needs_audio": True,
+            # current_audio_data is the mastered mix as int16 PCM, which is written as-is
+            "save": lambda audio_data, filepath, progress_callback: exporter.save_wav_file(audio_data, filepath, synthesizer.SAMPLE_RATE)},
+    "mp3": {"label": "MP3", "extension": ".mp3", "button": "btn_export_mp3", "needs_audio": True,
+            "save": lambda audio_data, filepath, progress_callback: exporter.save_mp3_file(
+                audio_data, filepath, synthesizer.SAMPLE_RATE, progress_callback=progress_callback)},
+}
 
 
 if __name__ == "__main__":
@@ -1,4 +1,6 @@
 # music_theory.py
+import functools
+import numpy as np
 
 # MIDI note numbers for C0 octave
 NOTE_TO_MIDI_BASE = {
@@ -11,11 +13,13 @@ NOTE_TO_MIDI_BASE = {
     'B': 11, 'CB': 11,
 }
 
+@functools.lru_cache(maxsize=None)
 def note_to_midi(note_name: str, octave: int) -> int:
     """
     Converts a musical note name (e.g., "C", "C#", "Db") and octave
     to its corresponding MIDI note number.
     C4 is MIDI note 60.
+    Memoized: the generators convert the same few range limits (C4, G3, ...) over and over.
     """
     note_name_upper = note_name.upper()
     if note_name_upper not in NOTE_TO_MIDI_BASE:
@@ -79,6 +83,9 @@ if __name__ == '__main__':
 MIDI_TO_NOTE_NAME_SHARP = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
 # MIDI_TO_NOTE_NAME_FLAT = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B'] # For alternative naming
 
+# Name of every MIDI note (e.g. "C4" for 60); there are only 128, so they're all spelled out up front
+_MIDI_NOTE_NAMES_SHARP = tuple(f"{MIDI_TO_NOTE_NAME_SHARP[midi_note % 12]}{(midi_note // 12) - 1}" for midi_note in range(128))
+
 def midi_to_note_name(midi_note: int, prefer_sharps: bool = True) -> str:
     """
     Converts a MIDI note number to its musical note name and octave.
@@ -87,17 +94,12 @@ def midi_to_note_name(midi_note: int, prefer_sharps: bool = True) -> str:
     if not (0 <= midi_note <= 127):
         raise ValueError(f"MIDI note {midi_note} is out of range [0, 127].")
 
-    octave = (midi_note // 12) - 1
-    note_index = midi_note % 12
-
     if prefer_sharps:
-        note_name = MIDI_TO_NOTE_NAME_SHARP[note_index]
+        return _MIDI_NOTE_NAMES_SHARP[midi_note]
     else:
         # Could implement flat preference here if needed, using MIDI_TO_NOTE_NAME_FLAT
         # For now, defaulting to sharps or the primary name.
-        note_name = MIDI_TO_NOTE_NAME_SHARP[note_index] # Placeholder, can be improved
-
-    return f"{note_name}{octave}"
+        return _MIDI_NOTE_NAMES_SHARP[midi_note] # Placeholder, can be improved
 
 if __name__ == '__main__':
     print("\nTesting midi_to_note_name:")
@@ -115,24 +117,24 @@ if __name__ == '__main__':
 
 # Scale definitions (intervals in semitones from the root)
 SCALE_INTERVALS = {
-    "major": [0, 2, 4, 5, 7, 9, 11],  # W-W-H-W-W-W-H
-    "minor": [0, 2, 3, 5, 7, 8, 10],  # Natural minor: W-H-W-W-H-W-W
+    "major": (0, 2, 4, 5, 7, 9, 11),  # W-W-H-W-W-W-H
+    "minor": (0, 2, 3, 5, 7, 8, 10),  # Natural minor: W-H-W-W-H-W-W
     # Can add more scales like harmonic minor, melodic minor, pentatonic, etc. later
-    "harmonic_minor": [0, 2, 3, 5, 7, 8, 11],
-    "melodic_minor_asc": [0, 2, 3, 5, 7, 9, 11], # Melodic minor (ascending)
-    "dorian": [0, 2, 3, 5, 7, 9, 10],
-    "phrygian": [0, 1, 3, 5, 7, 8, 10],
-    "lydian": [0, 2, 4, 6, 7, 9, 11],
-    "mixolydian": [0, 2, 4, 5, 7, 9, 10],
-    "locrian": [0, 1, 3, 4, 6, 8, 10], # Rarely used harmonically
-    "major_pentatonic": [0, 2, 4, 7, 9],
-    "minor_pentatonic": [0, 3, 5, 7, 10],
-    "blues": [0, 3, 5, 6, 7, 10], # Minor pentatonic + flat 5th
+    "harmonic_minor": (0, 2, 3, 5, 7, 8, 11),
+    "melodic_minor_asc": (0, 2, 3, 5, 7, 9, 11), # Melodic minor (ascending)
+    "dorian": (0, 2, 3, 5, 7, 9, 10),
+    "phrygian": (0, 1, 3, 5, 7, 8, 10),
+    "lydian": (0, 2, 4, 6, 7, 9, 11),
+    "mixolydian": (0, 2, 4, 5, 7, 9, 10),
+    "locrian": (0, 1, 3, 4, 6, 8, 10), # Rarely used harmonically
+    "major_pentatonic": (0, 2, 4, 7, 9),
+    "minor_pentatonic": (0, 3, 5, 7, 10),
+    "blues": (0, 3, 5, 6, 7, 10), # Minor pentatonic + flat 5th
 }
 
-def get_scale_notes(key_root_midi: int, key_type: str, num_octaves: int = 2) -> list[int]:
+def get_scale_notes(key_root_midi: int, key_type: str, num_octaves: int = 2) -> tuple[int, ...]:
     """
-    Generates a list of MIDI note numbers for a given scale and key.
+    Generates an ascending tuple of MIDI note numbers for a given scale and key.
     `key_type` can be "major", "minor", etc. as defined in SCALE_INTERVALS.
     `num_octaves` specifies how many octaves of the scale to generate, starting from the octave of key_root_midi.
     """
@@ -145,21 +147,33 @@ def get_scale_notes(key_root_midi: int, key_type: str, num_octaves: int = 2) ->
             print(f"Warning: Scale type '{key_type}' not recognized. Defaulting to major scale.")
             key_type_lower = "major"
 
-    intervals = SCALE_INTERVALS[key_type_lower]
-    scale_notes = []
+    return _scale_notes(key_root_midi, key_type_lower, num_octaves)
 
-    for i in range(num_octaves):
-        for interval in intervals:
-            note = key_root_midi + interval + (i * 12)
-            if 0 <= note <= 127:
-                scale_notes.append(note)
-    
+_scale_notes_cache = {} # (key_root_midi, key_type_lower, num_octaves) -> tuple of MIDI notes
+
+def _scale_notes(key_root_midi, key_type_lower, num_octaves):
+    """Returns the scale for get_scale_notes, building (and caching) it on first use."""
+    cache_key = (key_root_midi, key_type_lower, num_octaves)
+    scale_notes = _scale_notes_cache.get(cache_key)
+    if scale_notes is None:
+        scale_notes = _build_scales(np.array([key_root_midi]), key_type_lower, num_octaves)[0]
+        _scale_notes_cache[cache_key] = scale_notes
+    return scale_notes
+
+def _build_scales(roots_midi, key_type_lower, num_octaves):
+    """
+    Builds the scale starting at each root in roots_midi (a NumPy int array) at once:
+    the interval offsets of all octaves are broadcast against the roots, one row per root.
+    """
+    intervals = np.asarray(SCALE_INTERVALS[key_type_lower], dtype=np.int64)
+    offsets = (intervals[None, :] + 12 * np.arange(num_octaves, dtype=np.int64)[:, None]).ravel()
     # Add one more root note at the top for completeness over num_octaves
-    top_root = key_root_midi + (num_octaves * 12)
-    if 0 <= top_root <= 127:
-        scale_notes.append(top_root)
-        
-    return sorted(list(set(scale_notes))) # Remove duplicates and sort
+    offsets = np.unique(np.append(offsets, 12 * num_octaves)) # Remove duplicates and sort
+    scale_rows = roots_midi[:, None] + offsets[None, :]
+    # Rows are ascending, so the notes within MIDI range are one contiguous slice of each row
+    starts = np.count_nonzero(scale_rows < 0, axis=1).tolist()
+    ends = np.count_nonzero(scale_rows <= 127, axis=1).tolist()
+    return [tuple(row[start:end]) for row, start, end in zip(scale_rows.tolist(), starts, ends)]
 
 if __name__ == '__main__':
     print("\nTesting get_scale_notes:")
@@ -180,43 +194,43 @@ if __name__ == '__main__':
 
 # Chord definitions (intervals from the chord's root note)
 CHORD_TYPE_INTERVALS = {
-    "major_triad": [0, 4, 7],        # Root, Major Third, Perfect Fifth
-    "minor_triad": [0, 3, 7],        # Root, Minor Third, Perfect Fifth
-    "diminished_triad": [0, 3, 6],   # Root, Minor Third, Diminished Fifth
-    "augmented_triad": [0, 4, 8],    # Root, Major Third, Augmented Fifth
-    "major_seventh": [0, 4, 7, 11],  # Major Triad + Major Seventh
-    "minor_seventh": [0, 3, 7, 10],  # Minor Triad + Minor Seventh
-    "dominant_seventh": [0, 4, 7, 10],# Major Triad + Minor Seventh
-    "diminished_seventh": [0, 3, 6, 9],# Diminished Triad + Diminished Seventh (interval is 6 semitones above minor third)
-    "half_diminished_seventh": [0, 3, 6, 10], # Diminished Triad + Minor Seventh
-    "sus2": [0, 2, 7], # Root, Major Second, Perfect Fifth
-    "sus4": [0, 5, 7], # Root, Perfect Fourth, Perfect Fifth
+    "major_triad": (0, 4, 7),        # Root, Major Third, Perfect Fifth
+    "minor_triad": (0, 3, 7),        # Root, Minor Third, Perfect Fifth
+    "diminished_triad": (0, 3, 6),   # Root, Minor Third, Diminished Fifth
+    "augmented_triad": (0, 4, 8),    # Root, Major Third, Augmented Fifth
+    "major_seventh": (0, 4, 7, 11),  # Major Triad + Major Seventh
+    "minor_seventh": (0, 3, 7, 10),  # Minor Triad + Minor Seventh
+    "dominant_seventh": (0, 4, 7, 10),# Major Triad + Minor Seventh
+    "diminished_seventh": (0, 3, 6, 9),# Diminished Triad + Diminished Seventh (interval is 6 semitones above minor third)
+    "half_diminished_seventh": (0, 3, 6, 10), # Diminished Triad + Minor Seventh
+    "sus2": (0, 2, 7), # Root, Major Second, Perfect Fifth
+    "sus4": (0, 5, 7), # Root, Perfect Fourth, Perfect Fifth
 }
 
-# Diatonic chords for major and minor keys (degree, type)
+# Diatonic chord types for major and minor keys, indexed by scale degree - 1
 # Roman numerals: I, II, III, IV, V, VI, VII
 # For major: I (maj), ii (min), iii (min), IV (maj), V (maj), vi (min), vii° (dim)
 # For natural minor: i (min), ii° (dim), III (maj), iv (min), v (min), VI (maj), VII (maj)
 # Using dominant V for minor (harmonic minor): i (min), ii° (dim), III+ (aug), iv (min), V (maj), VI (maj), vii° (dim)
 
-DIATONIC_CHORDS_MAJOR = {
-    1: "major_triad", 2: "minor_triad", 3: "minor_triad", 4: "major_triad",
-    5: "major_triad", 6: "minor_triad", 7: "diminished_triad"
-}
-DIATONIC_CHORDS_MINOR = { # Using harmonic minor for V chord
-    1: "minor_triad", 2: "diminished_triad", 3: "augmented_triad", 4: "minor_triad",
-    5: "major_triad", 6: "major_triad", 7: "diminished_triad"
-}
+DIATONIC_CHORDS_MAJOR = (
+    "major_triad", "minor_triad", "minor_triad", "major_triad",
+    "major_triad", "minor_triad", "diminished_triad"
+)
+DIATONIC_CHORDS_MINOR = ( # Using harmonic minor for V chord
+    "minor_triad", "diminished_triad", "augmented_triad", "minor_triad",
+    "major_triad", "major_triad", "diminished_triad"
+)
 # Simpler natural minor variant if preferred for some moods:
-# DIATONIC_CHORDS_MINOR_NATURAL = {
-#     1: "minor_triad", 2: "diminished_triad", 3: "major_triad", 4: "minor_triad",
-#     5: "minor_triad", 6: "major_triad", 7: "major_triad"
-# }
+# DIATONIC_CHORDS_MINOR_NATURAL = (
+#     "minor_triad", "diminished_triad", "major_triad", "minor_triad",
+#     "minor_triad", "major_triad", "major_triad"
+# )
 
 
-def get_chord_notes(chord_root_midi: int, chord_type: str) -> list[int]:
+def get_chord_notes(chord_root_midi: int, chord_type: str) -> tuple[int, ...]:
     """
-    Generates the MIDI notes for a given chord.
+    Generates the MIDI notes for a given chord, as a tuple.
     `chord_type` refers to keys in CHORD_TYPE_INTERVALS.
     """
     chord_type_lower = chord_type.lower()
@@ -230,30 +244,71 @@ def get_chord_notes(chord_root_midi: int, chord_type: str) -> list[int]:
             print(f"Warning: Chord type '{chord_type}' not recognized. Defaulting to major triad.")
             chord_type_lower = "major_triad"
 
+    return _chord_notes(chord_root_midi, chord_type_lower)
+
+@functools.lru_cache(maxsize=None)
+def _chord_notes(chord_root_midi, chord_type_lower):
+    """Builds the chord for get_chord_notes; memoized, as there are only a couple thousand distinct chords."""
     intervals = CHORD_TYPE_INTERVALS[chord_type_lower]
     chord_notes = []
     for interval in intervals:
         note = chord_root_midi + interval
         if 0 <= note <= 127: # Ensure notes are within MIDI range
             chord_notes.append(note)
-    return chord_notes
+    return tuple(chord_notes)
+
+
+def _warm_caches():
+    """Fills the scale and chord caches for every MIDI root, so generation never builds one on the fly."""
+    roots_midi = np.arange(128)
+    for key_type_lower in SCALE_INTERVALS:
+        for num_octaves in (1, 2): # The octave counts the generators ask for
+            for root_midi, scale_notes in enumerate(_build_scales(roots_midi, key_type_lower, num_octaves)):
+                _scale_notes_cache[(root_midi, key_type_lower, num_octaves)] = scale_notes
+    for root_midi in range(128):
+        for chord_type_lower in CHORD_TYPE_INTERVALS:
+            _chord_notes(root_midi, chord_type_lower)
+
+_warm_caches()
+
+
+@functools.lru_cache(maxsize=None)
+def _is_major_key_type(key_type):
+    """Whether generate_chord_progression treats key_type as a major key; memoized, as there are only a few key types."""
+    key_type_lower = key_type.lower()
+    return "major" in key_type_lower or \
+           (key_type_lower not in ["minor", "dorian", "phrygian", "locrian"] and "minor" not in key_type_lower)
+
+
+@functools.lru_cache(maxsize=None)
+def _diatonic_chords(scale_roots, is_major_key):
+    """
+    Returns (root_midi, chord_type, notes, name) for each of the 7 diatonic chords built on scale_roots
+    (the first 7 notes of the key's scale), as used by generate_chord_progression.
+    """
+    diatonic_map = DIATONIC_CHORDS_MAJOR if is_major_key else DIATONIC_CHORDS_MINOR
+    roman_numerals = ["I", "ii", "iii", "IV", "V", "vi", "vii°"] if is_major_key \
+        else ["i", "ii°", "III+", "iv", "V", "VI", "vii°"] # Minor based on harmonic minor
+    chords = []
+    for degree, chord_root_note_midi in enumerate(scale_roots, start=1):
+        chord_type = diatonic_map[degree - 1]
+        # For display/info purposes, get a name
+        pitch_class_name = MIDI_TO_NOTE_NAME_SHARP[chord_root_note_midi % 12] # Note name without the octave
+        chords.append((chord_root_note_midi, chord_type, get_chord_notes(chord_root_note_midi, chord_type),
+                       f"{roman_numerals[degree - 1]} ({pitch_class_name} {chord_type})"))
+    return tuple(chords)
 
 
 def generate_chord_progression(key_root_midi: int, key_type: str, num_chords: int) -> list[dict]:
     """
     Generates a chord progression for a given key and number of chords.
     Returns a list of dictionaries, where each dict is:
-    {'root_midi': int, 'chord_type': str, 'notes': list[int]}
+    {'root_midi': int, 'chord_type': str, 'notes': tuple[int, ...]}
     """
-    key_type_lower = key_type.lower()
-    is_major_key = "major" in key_type_lower or \
-                   (key_type_lower not in ["minor", "dorian", "phrygian", "locrian"] and "minor" not in key_type_lower)
-
+    is_major_key = _is_major_key_type(key_type)
 
     scale_notes_for_key = get_scale_notes(key_root_midi, "major" if is_major_key else "harmonic_minor", 1) # Get one octave for roots
 
-    diatonic_map = DIATONIC_CHORDS_MAJOR if is_major_key else DIATONIC_CHORDS_MINOR
-
     progression = []
 
     # Simple I-IV-V-I style progressions, cycling or extending
@@ -313,43 +368,35 @@ def generate_chord_progression(key_root_midi: int, key_type: str, num_chords: in
         return progression
 
 
+    # Every degree's chord is looked up once per key, see _diatonic_chords
+    diatonic_chords = _diatonic_chords(tuple(scale_notes_for_key[:7]), is_major_key)
     for i in range(num_chords):
         degree = chosen_pattern_indices[i % len(chosen_pattern_indices)]
-        
-        # Get root of the chord (degree-1 because scale_notes is 0-indexed)
-        # Ensure we don't go out of bounds if scale_notes_for_key is unexpectedly short
-        if degree -1 >= len(scale_notes_for_key):
-            print(f"Warning: Degree {degree} out of bounds for scale. Using tonic.")
-            chord_root_note_midi = key_root_midi
-            chord_type = diatonic_map[1]
-        else:
-            chord_root_note_midi = scale_notes_for_key[degree - 1]
-            chord_type = diatonic_map[degree]
-
-        chord_notes = get_chord_notes(chord_root_note_midi, chord_type)
-        
-        # For display/info purposes, get a name
-        roman_numerals_major = ["I", "ii", "iii", "IV", "V", "vi", "vii°"]
-        roman_numerals_minor = ["i", "ii°", "III+", "iv", "V", "VI", "vii°"] # Based on harmonic minor
-        
-        numeral = ""
-        if degree -1 < len(roman_numerals_major): # Defensive check
-            if is_major_key:
-                numeral = roman_numerals_major[degree-1]
-            else:
-                numeral = roman_numerals_minor[degree-1]
-
-
+        chord_root_note_midi, chord_type, chord_notes, chord_name = diatonic_chords[degree - 1]
         progression.append({
             "root_midi": chord_root_note_midi,
             "chord_type": chord_type,
             "notes": chord_notes,
             "degree": degree,
-            "name": f"{numeral} ({midi_to_note_name(chord_root_note_midi).replace(str((chord_root_note_midi // 12) - 1),'')} {chord_type})"
+            "name": chord_name
         })
 
     return progression
 
+def generate_chord_progressions(key_root_midi: int, key_type: str, chord_counts: list[int]) -> list[list[dict]]:
+    """
+    Batch version of generate_chord_progression for several sections in the same key, one
+    progression per entry of chord_counts. A progression only depends on its chord count, so each
+    distinct count is generated once; every returned progression still gets its own chord dicts.
+    """
+    progressions_by_count = {}
+    progressions = []
+    for num_chords in chord_counts:
+        if num_chords not in progressions_by_count:
+            progressions_by_count[num_chords] = generate_chord_progression(key_root_midi, key_type, num_chords)
+        progressions.append([dict(chord) for chord in progressions_by_count[num_chords]])
+    return progressions
+
 
 if __name__ == '__main__':
     print("\nTesting get_chord_notes:")
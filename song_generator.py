@@ -1,4 +1,8 @@
+import bisect
 import random
+from functools import lru_cache
+from operator import attrgetter
+import numpy as np
 import music_theory
 
 # --- Global Song Parameters (can be adjusted by UI later) ---
@@ -6,6 +10,16 @@ DEFAULT_BPM = 120
 DEFAULT_KEY_ROOT_MIDI = music_theory.note_to_midi("C", 4) # C4
 DEFAULT_KEY_TYPE = "major" # "major" or "minor"
 
+# Register boundaries used by the part generators, resolved once at import
+_C2 = music_theory.note_to_midi("C", 2)
+_C3 = music_theory.note_to_midi("C", 3)
+_C4 = music_theory.note_to_midi("C", 4)
+_C5 = music_theory.note_to_midi("C", 5)
+_C6 = music_theory.note_to_midi("C", 6)
+_G3 = music_theory.note_to_midi("G", 3)
+_G5 = music_theory.note_to_midi("G", 5)
+_RANGE_BY_LAYER = {"Melody": (_C4, _C6), "Harmony Line": (_G3, _G5), "Counter-Melody": (_C3, _C5)}
+
 # Song Structure Definition (fixed as per requirements)
 SONG_STRUCTURE_TEMPLATE = ["Chorus", "Verse", "Chorus", "Verse", "Chorus", "Bridge", "Chorus"]
 
@@ -17,7 +31,12 @@ SECTION_LENGTH_BARS = {
     "Bridge": 4,
 }
 
+_event_start = attrgetter("time_start")
+_event_sort_key = attrgetter("time_start", "note", "duration")
+
 class MIDIEvent:
+    __slots__ = ("type", "note", "velocity", "time_start", "duration", "channel") # No per-event __dict__
+
     def __init__(self, type, note, velocity, time_start, duration, channel=0):
         self.type = type
         self.note = note
@@ -29,109 +48,153 @@ class MIDIEvent:
     def __repr__(self):
         return f"MIDIEvent(type={self.type}, note={self.note}, vel={self.velocity}, start={self.time_start:.2f}, dur={self.duration:.2f}, ch={self.channel})"
 
-def generate_pads(chord_progression_details, section_start_time, section_duration_beats, channel, key_root_midi, key_type):
+def _new_rng():
+    """NumPy generator seeded from the `random` module, so random.seed() still reproduces a song."""
+    return np.random.default_rng(random.getrandbits(64))
+
+def generate_pads(chord_progression_details, section_start_time, section_duration_beats, channel, key_root_midi, key_type, rng=None):
     pad_events = []
     num_chords = len(chord_progression_details)
     if num_chords == 0:
         return []
+    if rng is None: rng = _new_rng()
+    vel_rolls = rng.random(sum(len(chord_info["notes"]) for chord_info in chord_progression_details)).tolist()
+    vel_idx = 0
 
     duration_per_chord = section_duration_beats / num_chords
     current_time = section_start_time
 
     for chord_info in chord_progression_details:
         for note_midi in chord_info["notes"]:
-            adjusted_note = note_midi
-            while adjusted_note > music_theory.note_to_midi("C", 5):
-                adjusted_note -= 12
-            while adjusted_note < music_theory.note_to_midi("C", 3):
-                 adjusted_note +=12
+            # Fold into C3..C5 by whole octaves in one step
+            adjusted_note = note_midi - 12 * max(0, (note_midi - _C5 + 11) // 12)
+            adjusted_note += 12 * max(0, (_C3 - adjusted_note + 11) // 12)
 
             if 0 <= adjusted_note <= 127:
                  pad_events.append(MIDIEvent(
-                    type='note', note=adjusted_note, velocity=random.randint(60, 80),
+                    type='note', note=adjusted_note, velocity=60 + int(vel_rolls[vel_idx] * 21),
                     time_start=current_time, duration=duration_per_chord * 0.95, channel=channel
                 ))
+            vel_idx += 1
         current_time += duration_per_chord
     return pad_events
 
-def generate_bassline(chord_progression_details, section_start_time, section_duration_beats, channel, key_root_midi, key_type, mood):
+def generate_bassline(chord_progression_details, section_start_time, section_duration_beats, channel, key_root_midi, key_type, mood, rng=None):
     bass_events = []
     num_chords = len(chord_progression_details)
     if num_chords == 0: return []
     beats_per_chord = section_duration_beats / num_chords
     current_time = section_start_time
+    if rng is None: rng = _new_rng()
+    downbeat_rolls, offbeat_rolls = rng.random((2, num_chords)).tolist()
 
-    for chord_info in chord_progression_details:
+    for i, chord_info in enumerate(chord_progression_details):
         bass_note_midi = chord_info["root_midi"]
-        if bass_note_midi >= music_theory.note_to_midi("C", 3): bass_note_midi -= 12
-        if bass_note_midi >= music_theory.note_to_midi("C", 2): bass_note_midi -=12
+        if bass_note_midi >= _C3: bass_note_midi -= 12
+        if bass_note_midi >= _C2: bass_note_midi -=12
         bass_note_midi = max(0, min(127, bass_note_midi))
 
         if beats_per_chord >= BAR_LENGTH_BEATS:
-            bass_events.append(MIDIEvent('note', bass_note_midi, random.randint(90,110), current_time, beats_per_chord * 0.45, channel))
-            bass_events.append(MIDIEvent('note', bass_note_midi, random.randint(85,100), current_time + beats_per_chord * 0.5, beats_per_chord * 0.45, channel))
+            bass_events.append(MIDIEvent('note', bass_note_midi, 90 + int(downbeat_rolls[i] * 21), current_time, beats_per_chord * 0.45, channel))
+            bass_events.append(MIDIEvent('note', bass_note_midi, 85 + int(offbeat_rolls[i] * 16), current_time + beats_per_chord * 0.5, beats_per_chord * 0.45, channel))
         else:
-            bass_events.append(MIDIEvent('note', bass_note_midi, random.randint(90,110), current_time, beats_per_chord * 0.9, channel))
+            bass_events.append(MIDIEvent('note', bass_note_midi, 90 + int(downbeat_rolls[i] * 21), current_time, beats_per_chord * 0.9, channel))
         current_time += beats_per_chord
     return bass_events
 
-def generate_melody_line(chord_progression_details, section_start_time, section_duration_beats, channel, key_root_midi, key_type, mood, layer_name="Melody"):
-    melody_events = []
+# Per-mood choices for how many melody notes a chord gets
+_MELODY_SEGMENT_CHOICES = {"Happy": (2,3,4), "Sad": (1,2)}
+
+@lru_cache(maxsize=None)
+def _melody_chord_pool(chord_tones, key_root_midi, key_type):
+    """
+    (possible_notes, chord_tone_candidates) for one chord of a key, see _melody_note_pools.
+    Memoized: a key only has a handful of distinct chords, repeated across sections and songs.
+    """
     scale_notes = music_theory.get_scale_notes(key_root_midi, key_type)
-    melodic_range_notes = [n for n in scale_notes if music_theory.note_to_midi("C", 4) <= n <= music_theory.note_to_midi("C", 6)]
-    if not melodic_range_notes: melodic_range_notes = scale_notes
-    num_chords = len(chord_progression_details)
-    if num_chords == 0 or not melodic_range_notes: return []
+    in_range_scale_notes = {n for n in scale_notes if _C4 <= n <= _C6}
+    # The scale part is already in range, only the chord tones need the range check
+    possible_set = in_range_scale_notes.union(n for n in chord_tones if _C4 <= n <= _C6) or set(scale_notes)
+    possible_notes = tuple(sorted(possible_set))
+    candidate_notes = tuple(n for n in chord_tones if n in possible_set) or possible_notes
+    return possible_notes, candidate_notes
+
+def _melody_note_pools(chord_progression_details, key_root_midi, key_type):
+    """
+    Per chord (possible_notes, chord_tone_candidates) for generate_melody_line. These don't depend
+    on the layer, so generate_events_for_section computes them once for the melody and counter-melody.
+    Empty if there are no chords or no usable melodic range.
+    """
+    if not music_theory.get_scale_notes(key_root_midi, key_type): return []
+    return [_melody_chord_pool(chord_info["notes"], key_root_midi, key_type) for chord_info in chord_progression_details]
+
+def generate_melody_line(chord_progression_details, section_start_time, section_duration_beats, channel, key_root_midi, key_type, mood, layer_name="Melody", rng=None, note_pools=None):
+    melody_events = []
+    if note_pools is None: note_pools = _melody_note_pools(chord_progression_details, key_root_midi, key_type)
+    num_chords = len(note_pools)
+    if num_chords == 0: return []
     beats_per_chord = section_duration_beats / num_chords
     current_event_time = section_start_time
     last_note = None
+    min_note, max_note = _RANGE_BY_LAYER.get(layer_name, (_C4, _C6))
 
-    for i, chord_info in enumerate(chord_progression_details):
-        chord_tones = chord_info["notes"]
-        possible_notes = sorted(list(set(chord_tones + melodic_range_notes)))
-        possible_notes = [n for n in possible_notes if music_theory.note_to_midi("C", 4) <= n <= music_theory.note_to_midi("C", 6)]
-        if not possible_notes: possible_notes = melodic_range_notes
+    # All random draws for the section up front: segment sizes, then per-note branch/step chances, picks and velocities
+    if rng is None: rng = _new_rng()
+    segment_choices = _MELODY_SEGMENT_CHOICES.get(mood, (2,3))
+    segment_sizes = [segment_choices[int(roll * len(segment_choices))] for roll in rng.random(num_chords).tolist()]
+    branch_rolls, step_rolls, pick_rolls, vel_rolls = rng.random((4, sum(segment_sizes))).tolist()
+    note_idx = 0
 
-        notes_in_this_chord_segment = random.choice([2,3,4] if mood == "Happy" else [1,2] if mood == "Sad" else [2,3])
+    for i, (possible_notes, candidate_notes) in enumerate(note_pools):
+        notes_in_this_chord_segment = segment_sizes[i]
         duration_per_note = beats_per_chord / notes_in_this_chord_segment if notes_in_this_chord_segment > 0 else beats_per_chord
 
         for _ in range(notes_in_this_chord_segment):
             selected_note = None
-            if random.random() < 0.7 or last_note is None:
-                candidate_notes = [n for n in chord_tones if n in possible_notes]
-                if not candidate_notes: candidate_notes = possible_notes
-                selected_note = random.choice(candidate_notes) if candidate_notes else None
+            pick_roll = pick_rolls[note_idx]
+            if branch_rolls[note_idx] < 0.7 or last_note is None:
+                selected_note = candidate_notes[int(pick_roll * len(candidate_notes))] if candidate_notes else None
             else:
                 step_candidates = [n for n in possible_notes if abs(n - last_note) <= 2 and n != last_note] # type: ignore
-                if step_candidates and random.random() < 0.6:
-                    selected_note = random.choice(step_candidates)
+                if step_candidates and step_rolls[note_idx] < 0.6:
+                    selected_note = step_candidates[int(pick_roll * len(step_candidates))]
                 else:
-                    selected_note = random.choice(possible_notes) if possible_notes else None
+                    selected_note = possible_notes[int(pick_roll * len(possible_notes))] if possible_notes else None
 
             if selected_note is not None:
-                min_note, max_note = music_theory.note_to_midi("C",4), music_theory.note_to_midi("C",6)
-                if layer_name == "Harmony Line": min_note, max_note = music_theory.note_to_midi("G",3), music_theory.note_to_midi("G",5)
-                elif layer_name == "Counter-Melody": min_note, max_note = music_theory.note_to_midi("C",3), music_theory.note_to_midi("C",5)
-                while selected_note < min_note and selected_note + 12 <= max_note : selected_note += 12
-                while selected_note > max_note and selected_note - 12 >= min_note : selected_note -= 12
+                # Shift by whole octaves toward the range without overshooting it, then clamp
+                selected_note += 12 * max(0, min((min_note - selected_note + 11) // 12, (max_note - selected_note) // 12))
+                selected_note -= 12 * max(0, min((selected_note - max_note + 11) // 12, (selected_note - min_note) // 12))
                 selected_note = max(min_note, min(max_note, selected_note))
-                melody_events.append(MIDIEvent('note',selected_note,random.randint(80,115),current_event_time,duration_per_note*0.85,channel))
+                melody_events.append(MIDIEvent('note',selected_note,80 + int(vel_rolls[note_idx] * 36),current_event_time,duration_per_note*0.85,channel))
                 last_note = selected_note
             current_event_time += duration_per_note
+            note_idx += 1
     return melody_events
 
-def generate_harmony_line(main_melody_events, chord_progression_details, section_start_time, section_duration_beats, channel, key_root_midi, key_type, mood):
+@lru_cache(maxsize=None)
+def _harmony_chord_tones(chord_tones, key_root_midi, key_type):
+    """The chord's tones within the harmony range (G3..G5 scale notes) of the key. Memoized like _melody_chord_pool."""
+    scale_notes = music_theory.get_scale_notes(key_root_midi, key_type)
+    harmony_range_set = {n for n in scale_notes if _G3 <= n <= _G5} or set(scale_notes)
+    return tuple(n for n in chord_tones if n in harmony_range_set)
+
+def generate_harmony_line(main_melody_events, chord_progression_details, section_start_time, section_duration_beats, channel, key_root_midi, key_type, mood, rng=None):
     harmony_events = []
+    if rng is None: rng = _new_rng()
+    pick_rolls, drop_rolls = rng.random((2, len(main_melody_events))).tolist()
     scale_notes = music_theory.get_scale_notes(key_root_midi, key_type)
-    harmony_range_notes = [n for n in scale_notes if music_theory.note_to_midi("G", 3) <= n <= music_theory.note_to_midi("G", 5)]
+    harmony_range_notes = [n for n in scale_notes if _G3 <= n <= _G5]
     if not harmony_range_notes: harmony_range_notes = scale_notes
+    # Each chord's tones within the harmony range, filtered once instead of per melody note
+    chord_range_tones = [_harmony_chord_tones(chord_info["notes"], key_root_midi, key_type) for chord_info in chord_progression_details]
+    num_chords = len(chord_progression_details)
+    beats_per_chord = section_duration_beats / num_chords if num_chords > 0 else section_duration_beats
 
-    for melody_event in main_melody_events:
+    for event_idx, melody_event in enumerate(main_melody_events):
         melody_note = melody_event.note
         harmony_note_candidate = None
         current_chord = None
-        num_chords = len(chord_progression_details)
-        beats_per_chord = section_duration_beats / num_chords if num_chords > 0 else section_duration_beats
 
         chord_idx = 0
         if beats_per_chord > 0 :
@@ -140,84 +203,132 @@ def generate_harmony_line(main_melody_events, chord_progression_details, section
         if 0 <= chord_idx < num_chords: current_chord = chord_progression_details[chord_idx]
 
         if current_chord:
-            possible_harmony_notes = [n for n in current_chord["notes"] if n != melody_note and n in harmony_range_notes]
+            possible_harmony_notes = [n for n in chord_range_tones[chord_idx] if n != melody_note]
             if not possible_harmony_notes: possible_harmony_notes = [n for n in harmony_range_notes if n != melody_note]
             if possible_harmony_notes:
                 lower_candidates = [n for n in possible_harmony_notes if n < melody_note]
-                harmony_note_candidate = random.choice(lower_candidates) if lower_candidates else random.choice(possible_harmony_notes)
+                harmony_note_candidate = lower_candidates[int(pick_rolls[event_idx] * len(lower_candidates))] if lower_candidates else possible_harmony_notes[int(pick_rolls[event_idx] * len(possible_harmony_notes))]
 
         if harmony_note_candidate is None: # Fallback
             fallback_candidates = [n for n in harmony_range_notes if n < melody_note]
-            if fallback_candidates: harmony_note_candidate = random.choice(fallback_candidates)
+            if fallback_candidates: harmony_note_candidate = fallback_candidates[int(pick_rolls[event_idx] * len(fallback_candidates))]
 
         if harmony_note_candidate is not None:
-            harmony_events.append(MIDIEvent('note',harmony_note_candidate,melody_event.velocity-random.randint(10,20),melody_event.time_start,melody_event.duration,channel))
+            harmony_events.append(MIDIEvent('note',harmony_note_candidate,melody_event.velocity-(10 + int(drop_rolls[event_idx] * 11)),melody_event.time_start,melody_event.duration,channel))
     return harmony_events
 
-def generate_counter_melody(main_melody_events, chord_progression_details, section_start_time, section_duration_beats, channel, key_root_midi, key_type, mood):
-    return generate_melody_line(chord_progression_details,section_start_time,section_duration_beats,channel,key_root_midi,key_type,mood,layer_name="Counter-Melody")
+def generate_counter_melody(main_melody_events, chord_progression_details, section_start_time, section_duration_beats, channel, key_root_midi, key_type, mood, rng=None, note_pools=None):
+    return generate_melody_line(chord_progression_details,section_start_time,section_duration_beats,channel,key_root_midi,key_type,mood,layer_name="Counter-Melody",rng=rng,note_pools=note_pools)
+
+# Hi-hat patterns (beat offsets within a bar) and per-mood hat settings for generate_drums
+_HAT_PATTERNS = {
+    "Happy": tuple(i*0.25 for i in range(16)), # 16th notes
+    "Sad": (0,1,2,3), # Quarter notes
+    "Chill": (0,1,1.5,2.5,3) # Syncopated
+}
+_DEFAULT_HAT_PATTERN = (0,0.5,1,1.5,2,2.5,3,3.5) # 8th notes
+_HAT_VEL_RANGES = {"Happy": (75,95), "Sad": (60,80), "Chill": (70,90)}
+_OPEN_HAT_CHANCES = {"Happy": 0.15, "Sad": 0.05, "Chill": 0.2}
+# Per-mood chances of the optional hits: (kick on beat 2, kick on beat 1.5, ghost snare on beat 2.5)
+_DRUM_FILL_CHANCES = {"Happy": (0.7, 0.4, 0.0), "Sad": (0.5, 0.0, 0.0), "Chill": (0.7, 0.0, 0.3)} # Sad: simpler kick
+
+def _hat_steps(pattern):
+    """
+    Resolves a hat pattern once into (step count, ((step index, beat offset, can open), ...)),
+    leaving out the steps that would clash with the snare on beats 1 and 3. Only off-beat
+    eighths and the pattern's last step can become open hats.
+    """
+    last_offset = max(pattern)
+    steps = tuple((hat_idx, beat_offset, beat_offset % 1 == 0.5 or beat_offset == last_offset)
+                  for hat_idx, beat_offset in enumerate(pattern)
+                  if not (abs(beat_offset - 1) < 0.1 or abs(beat_offset - 3) < 0.1)) # Avoid clash with snare
+    return len(pattern), steps
+
+_HAT_STEPS = {mood: _hat_steps(pattern) for mood, pattern in _HAT_PATTERNS.items()}
+_DEFAULT_HAT_STEPS = _hat_steps(_DEFAULT_HAT_PATTERN)
 
-def generate_drums(section_start_time, section_duration_beats, channel, mood):
+def generate_drums(section_start_time, section_duration_beats, channel, mood, rng=None):
     drum_events = []
     KICK_NOTE, SNARE_NOTE, HAT_NOTE, OPEN_HAT_NOTE = 60, 61, 62, 63 # Example MIDI notes
     num_bars = int(section_duration_beats / BAR_LENGTH_BEATS) if BAR_LENGTH_BEATS > 0 else 0
+
+    # Hi-Hats
+    num_hats, hat_steps = _HAT_STEPS.get(mood, _DEFAULT_HAT_STEPS)
+    hat_vel_low, hat_vel_high = _HAT_VEL_RANGES.get(mood, (70,90))
+    open_hat_chance = _OPEN_HAT_CHANCES.get(mood, 0.1)
+    kick2_chance, kick3_chance, ghost_chance = _DRUM_FILL_CHANCES.get(mood, (0.0, 0.0, 0.0))
+
+    # All random draws for the section up front, one row per bar
+    if rng is None: rng = _new_rng()
+    bar_rolls = rng.random((num_bars, 10)).tolist()
+    open_hat_rolls, hat_drop_rolls = rng.random((2, num_bars, num_hats)).tolist()
+
     for bar in range(num_bars):
         bar_start_time = section_start_time + (bar * BAR_LENGTH_BEATS)
+        kick2_roll, kick3_roll, ghost_roll, kick_vel, kick2_vel, kick3_vel, snare_vel, snare2_vel, ghost_vel, hat_vel = bar_rolls[bar]
         # Kick
-        drum_events.append(MIDIEvent('note', KICK_NOTE, random.randint(100,120), bar_start_time + 0, 0.1, channel))
-        if mood == "Happy" or mood == "Chill":
-            if random.random() < 0.7: drum_events.append(MIDIEvent('note', KICK_NOTE, random.randint(95,115), bar_start_time + 2, 0.1, channel))
-            if mood == "Happy" and random.random() < 0.4: drum_events.append(MIDIEvent('note', KICK_NOTE, random.randint(90,110), bar_start_time + 1.5, 0.1, channel))
-        elif mood == "Sad": # Simpler kick
-            if random.random() < 0.5 : drum_events.append(MIDIEvent('note', KICK_NOTE, random.randint(95,115), bar_start_time + 2, 0.1, channel))
+        drum_events.append(MIDIEvent('note', KICK_NOTE, 100 + int(kick_vel * 21), bar_start_time + 0, 0.1, channel))
+        if kick2_roll < kick2_chance: drum_events.append(MIDIEvent('note', KICK_NOTE, 95 + int(kick2_vel * 21), bar_start_time + 2, 0.1, channel))
+        if kick3_roll < kick3_chance: drum_events.append(MIDIEvent('note', KICK_NOTE, 90 + int(kick3_vel * 21), bar_start_time + 1.5, 0.1, channel))
         # Snare
-        drum_events.append(MIDIEvent('note', SNARE_NOTE, random.randint(90,110), bar_start_time + 1, 0.1, channel))
-        drum_events.append(MIDIEvent('note', SNARE_NOTE, random.randint(90,110), bar_start_time + 3, 0.1, channel))
-        if mood == "Chill" and random.random() < 0.3: drum_events.append(MIDIEvent('note', SNARE_NOTE, random.randint(60,80), bar_start_time + 2.5, 0.05, channel))
-
-        # Hi-Hats
-        hat_patterns = {
-            "Happy": [i*0.25 for i in range(16)], # 16th notes
-            "Sad": [0,1,2,3], # Quarter notes
-            "Chill": [0,1,1.5,2.5,3] # Syncopated
-        }
-        selected_hat_pattern = hat_patterns.get(mood, [0,0.5,1,1.5,2,2.5,3,3.5]) # Default to 8th notes
-
-        hat_vel_ranges = {"Happy": (75,95), "Sad": (60,80), "Chill": (70,90)}
-        hat_vel = random.randint(*hat_vel_ranges.get(mood, (70,90)))
-
-        open_hat_chances = {"Happy": 0.15, "Sad": 0.05, "Chill": 0.2}
-        open_hat_chance = open_hat_chances.get(mood, 0.1)
+        drum_events.append(MIDIEvent('note', SNARE_NOTE, 90 + int(snare_vel * 21), bar_start_time + 1, 0.1, channel))
+        drum_events.append(MIDIEvent('note', SNARE_NOTE, 90 + int(snare2_vel * 21), bar_start_time + 3, 0.1, channel))
+        if ghost_roll < ghost_chance: drum_events.append(MIDIEvent('note', SNARE_NOTE, 60 + int(ghost_vel * 21), bar_start_time + 2.5, 0.05, channel))
 
-        for beat_offset in selected_hat_pattern:
-            hat_time = bar_start_time + beat_offset
-            is_open_hat_trigger = random.random() < open_hat_chance and \
-                                (beat_offset % 1 == 0.5 or (selected_hat_pattern and beat_offset == max(selected_hat_pattern)))
+        hat_vel = hat_vel_low + int(hat_vel * (hat_vel_high - hat_vel_low + 1))
+        for hat_idx, beat_offset, can_open in hat_steps:
+            is_open_hat_trigger = can_open and open_hat_rolls[bar][hat_idx] < open_hat_chance
             note_to_use = OPEN_HAT_NOTE if is_open_hat_trigger else HAT_NOTE
             duration = 0.2 if is_open_hat_trigger else 0.08
-
-            # Avoid clash with snare
-            if not (abs(beat_offset - 1) < 0.1 or abs(beat_offset - 3) < 0.1):
-                 drum_events.append(MIDIEvent('note', note_to_use, hat_vel - random.randint(0,10), hat_time, duration, channel))
+            drum_events.append(MIDIEvent('note', note_to_use, hat_vel - int(hat_drop_rolls[bar][hat_idx] * 11), bar_start_time + beat_offset, duration, channel))
     return drum_events
 
+# Track names in display/mix order
+TRACK_NAMES = ("Melody", "Harmony Line", "Counter-Melody", "Bassline", "Pads", "Drums")
+
 class Song:
     def __init__(self):
-        self.tracks = {"Melody":[],"Harmony Line":[],"Counter-Melody":[],"Bassline":[],"Pads":[],"Drums":[]}
+        self.tracks = {track_name: [] for track_name in TRACK_NAMES}
         self.bpm = DEFAULT_BPM
         self.key_root_midi = DEFAULT_KEY_ROOT_MIDI
         self.key_type = DEFAULT_KEY_TYPE
         self.mood = "Happy"
         self.structure = SONG_STRUCTURE_TEMPLATE # Default structure
         self.section_details = [] # Will store {'name': str, 'start_beat': float, 'duration_beats': float, 'chord_progression': list}
+        self.track_arrays = {} # Per-track NumPy arrays of the note events, see build_track_arrays()
+        self.notes_end_beat = 0.0 # Beat at which the last note ends, cached by build_track_arrays()
 
     def get_all_events(self):
         all_events = [event for track_events in self.tracks.values() for event in track_events]
-        all_events.sort(key=lambda x: (x.time_start, x.note, x.duration)) # Sort by time, then note, then duration
+        all_events.sort(key=_event_sort_key) # Sort by time, then note, then duration
         return all_events
 
     def get_events_by_track(self): return self.tracks
 
+    def build_track_arrays(self):
+        """
+        Caches each track's note events as parallel NumPy arrays (structure of arrays) in
+        self.track_arrays[track_name]: 't' start beats, 'd' durations (float32), 'n' MIDI notes (int16)
+        and 'i' the event's index in self.tracks[track_name]. Also caches self.notes_end_beat.
+        Must be called again whenever self.tracks changes.
+        """
+        self.track_arrays = {}
+        for track_name, events in self.tracks.items():
+            note_indices = [idx for idx, event in enumerate(events) if event.type == 'note']
+            count = len(note_indices)
+            self.track_arrays[track_name] = {
+                't': np.fromiter((events[idx].time_start for idx in note_indices), dtype=np.float32, count=count),
+                'd': np.fromiter((events[idx].duration for idx in note_indices), dtype=np.float32, count=count),
+                'n': np.fromiter((events[idx].note for idx in note_indices), dtype=np.int16, count=count),
+                'i': np.array(note_indices, dtype=np.int32),
+            }
+        self.notes_end_beat = max((float((arrays['t'] + arrays['d']).max())
+                                   for arrays in self.track_arrays.values() if arrays['t'].size > 0), default=0.0)
+        return self.track_arrays
+
+# Key type fixed by the mood; any other mood picks one at random
+_MOOD_KEY_TYPES = {"Happy": "major", "Sad": "minor"}
+
 # MIDI channels (0-indexed)
 CHANNEL_MAP = {"Melody":0,"Harmony Line":1,"Counter-Melody":2,"Bassline":3,"Pads":4,"Drums":9 }
 
@@ -226,21 +337,22 @@ def generate_full_song(mood="Happy", key_root_name="C", key_octave=4, bpm=120):
     song.mood = mood
     song.bpm = bpm
     try: song.key_root_midi = music_theory.note_to_midi(key_root_name, key_octave)
-    except ValueError: song.key_root_midi = music_theory.note_to_midi("C", 4) # Default C4
+    except ValueError: song.key_root_midi = _C4 # Default C4
 
-    song.key_type = "major" if mood == "Happy" else "minor" if mood == "Sad" else random.choice(["major", "minor"])
+    song.key_type = _MOOD_KEY_TYPES.get(mood) or random.choice(["major", "minor"])
 
     current_song_time_beats = 0.0
     song.section_details = [] # Clear any previous details
+    rng = _new_rng()
 
-    for section_name in song.structure: # Use song.structure which might have been set
-        section_length_bars = SECTION_LENGTH_BARS.get(section_name, 4) # Default to 4 bars
-        section_duration_beats = section_length_bars * BAR_LENGTH_BEATS
-        num_chords_in_section = section_length_bars * CHORDS_PER_BAR if BAR_LENGTH_BEATS > 0 else section_length_bars
+    # Use song.structure which might have been set
+    section_lengths_bars = [SECTION_LENGTH_BARS.get(section_name, 4) for section_name in song.structure] # Default to 4 bars
+    chord_counts = [section_length_bars * CHORDS_PER_BAR if BAR_LENGTH_BEATS > 0 else section_length_bars
+                    for section_length_bars in section_lengths_bars]
+    chord_progs = music_theory.generate_chord_progressions(song.key_root_midi, song.key_type, chord_counts)
 
-        chord_prog_for_section = music_theory.generate_chord_progression(
-            song.key_root_midi, song.key_type, num_chords_in_section
-        )
+    for section_name, section_length_bars, chord_prog_for_section in zip(song.structure, section_lengths_bars, chord_progs):
+        section_duration_beats = section_length_bars * BAR_LENGTH_BEATS
 
         current_section_detail = {
             "name": section_name,
@@ -253,52 +365,62 @@ def generate_full_song(mood="Happy", key_root_name="C", key_octave=4, bpm=120):
         song.section_details.append(current_section_detail)
 
         # Generate events for this section
-        section_events_by_track = generate_events_for_section(current_section_detail, chord_prog_for_section, song.mood, CHANNEL_MAP)
+        section_events_by_track = generate_events_for_section(current_section_detail, chord_prog_for_section, song.mood, CHANNEL_MAP, rng=rng)
         for track_name, events in section_events_by_track.items():
             song.tracks[track_name].extend(events)
 
         current_song_time_beats += section_duration_beats
 
+    song.build_track_arrays()
     return song
 
-def generate_events_for_section(section_detail, chord_prog_for_section, mood, channel_map):
+def generate_events_for_section(section_detail, chord_prog_for_section, mood, channel_map, rng=None):
     """
     Helper function to generate all layer events for a single section.
     `section_detail` should contain `start_beat`, `duration_beats`, `key_root_midi`, `key_type`.
-    Returns a dictionary: {"TrackName": [event1, event2], ...}
+    `rng` is the NumPy generator all layers draw from; a fresh one is made if omitted.
+    Returns a dictionary: {"TrackName": [event1, event2], ...} with each track's events sorted by time_start.
     """
-    section_events = {track_name: [] for track_name in Song().tracks.keys()}
+    section_events = {track_name: [] for track_name in TRACK_NAMES}
 
     s_time = section_detail['start_beat']
     s_dur = section_detail['duration_beats']
     s_key_root = section_detail['key_root_midi']
     s_key_type = section_detail['key_type']
 
+    if rng is None: rng = _new_rng()
+
     # Pads
     section_events["Pads"].extend(generate_pads(
-        chord_prog_for_section, s_time, s_dur, channel_map["Pads"], s_key_root, s_key_type
+        chord_prog_for_section, s_time, s_dur, channel_map["Pads"], s_key_root, s_key_type, rng=rng
     ))
     # Bassline
     section_events["Bassline"].extend(generate_bassline(
-        chord_prog_for_section, s_time, s_dur, channel_map["Bassline"], s_key_root, s_key_type, mood
+        chord_prog_for_section, s_time, s_dur, channel_map["Bassline"], s_key_root, s_key_type, mood, rng=rng
     ))
     # Melody (Primary)
+    melody_note_pools = _melody_note_pools(chord_prog_for_section, s_key_root, s_key_type) # Shared with the counter-melody
     mel_events = generate_melody_line(
-        chord_prog_for_section, s_time, s_dur, channel_map["Melody"], s_key_root, s_key_type, mood, layer_name="Melody"
+        chord_prog_for_section, s_time, s_dur, channel_map["Melody"], s_key_root, s_key_type, mood, layer_name="Melody", rng=rng,
+        note_pools=melody_note_pools
     )
     section_events["Melody"].extend(mel_events)
     # Harmony Line
     section_events["Harmony Line"].extend(generate_harmony_line(
-        mel_events, chord_prog_for_section, s_time, s_dur, channel_map["Harmony Line"], s_key_root, s_key_type, mood
+        mel_events, chord_prog_for_section, s_time, s_dur, channel_map["Harmony Line"], s_key_root, s_key_type, mood, rng=rng
     ))
     # Counter-Melody
     section_events["Counter-Melody"].extend(generate_counter_melody(
-        mel_events, chord_prog_for_section, s_time, s_dur, channel_map["Counter-Melody"], s_key_root, s_key_type, mood
+        mel_events, chord_prog_for_section, s_time, s_dur, channel_map["Counter-Melody"], s_key_root, s_key_type, mood, rng=rng,
+        note_pools=melody_note_pools
     ))
     # Drums
     section_events["Drums"].extend(generate_drums(
-        s_time, s_dur, channel_map["Drums"], mood
+        s_time, s_dur, channel_map["Drums"], mood, rng=rng
     ))
+    # Song tracks are kept sorted by start time (see regenerate_specific_section)
+    for events in section_events.values():
+        events.sort(key=_event_start)
     return section_events
 
 def regenerate_specific_section(song_object, section_index, channel_map):
@@ -334,17 +456,15 @@ def regenerate_specific_section(song_object, section_index, channel_map):
         channel_map
     )
 
-    # Remove old events from all tracks that fall within this section's time window
-    for track_name in song_object.tracks.keys():
-        song_object.tracks[track_name] = [
-            event for event in song_object.tracks[track_name]
-            if not (s_start_beat <= event.time_start < s_start_beat + s_duration_beats)
-        ]
-        # Add new events
-        song_object.tracks[track_name].extend(new_section_events_by_track.get(track_name, []))
-        # Re-sort track events by time (important!)
-        song_object.tracks[track_name].sort(key=lambda e: e.time_start)
+    # Replace the old events that fall within this section's time window. Tracks are kept sorted
+    # by time_start, so those are one contiguous slice and the new (sorted) events drop in its place.
+    s_end_beat = s_start_beat + s_duration_beats
+    for track_name, track_events in song_object.tracks.items():
+        lo = bisect.bisect_left(track_events, s_start_beat, key=_event_start)
+        hi = bisect.bisect_left(track_events, s_end_beat, lo=lo, key=_event_start)
+        track_events[lo:hi] = new_section_events_by_track.get(track_name, [])
 
+    song_object.build_track_arrays()
     return song_object
 
 
@@ -1,3 +1,4 @@
+import bisect
 import numpy as np
 import random
 import time
@@ -6,40 +7,115 @@ import audio_processing # For levels, panning, EQ, mastering
 # --- Global Synthesizer Parameters ---
 SAMPLE_RATE = 44100
 DEFAULT_AMPLITUDE = 0.5 # Base amplitude before track-specific leveling
+SILENT_NOTE_GAIN = 1e-6 # Notes with a lower gain (e.g. velocity 0 or a muted track) aren't rendered at all
+_noise_rng = np.random.default_rng() # Source for noise_wave
 
 # --- Waveform Generators (Identical to previous version) ---
+# Equal-tempered frequency of every MIDI note, A4 (69) = 440 Hz
+_MIDI_FREQUENCIES = tuple(440.0 * (2.0**((midi_note - 69) / 12.0)) for midi_note in range(128))
+
 def midi_to_frequency(midi_note):
     if not (0 <= midi_note <= 127): return 0
-    return 440.0 * (2.0**((midi_note - 69) / 12.0))
+    if midi_note != int(midi_note): return 440.0 * (2.0**((midi_note - 69) / 12.0)) # Microtonal
+    return _MIDI_FREQUENCIES[int(midi_note)]
+
+def _oscillator_phase(frequency, num_samples, sample_rate, offset=0.0):
+    """
+    Per-sample oscillator phase in cycles, wrapped to [0, 1), starting at `offset` cycles.
+    float32 throughout: over a note's few thousand cycles the rounding stays far below a sample.
+    """
+    phase = np.arange(num_samples, dtype=np.float32)
+    phase *= np.float32(frequency / sample_rate)
+    if offset: phase += np.float32(offset)
+    phase -= np.floor(phase)
+    return phase
 
 def pulse_wave(frequency, duration, duty_cycle=0.5, sample_rate=SAMPLE_RATE):
-    if frequency == 0: return np.zeros(int(duration * sample_rate))
-    t = np.linspace(0, duration, int(duration * sample_rate), endpoint=False)
-    period = 1.0 / frequency
-    wave = np.where( (t % period) < (period * duty_cycle), 1.0, -1.0)
-    return wave.astype(np.float32)
+    num_samples = int(duration * sample_rate)
+    if frequency == 0: return np.zeros(num_samples, dtype=np.float32)
+    phase = _oscillator_phase(frequency, num_samples, sample_rate)
+    return np.where(phase < duty_cycle, np.float32(1.0), np.float32(-1.0))
 
 def sawtooth_wave(frequency, duration, sample_rate=SAMPLE_RATE):
-    if frequency == 0: return np.zeros(int(duration * sample_rate))
-    t = np.linspace(0, duration, int(duration * sample_rate), endpoint=False)
-    wave = 2.0 * (t * frequency - np.floor(0.5 + t * frequency))
-    return wave.astype(np.float32)
+    num_samples = int(duration * sample_rate)
+    if frequency == 0: return np.zeros(num_samples, dtype=np.float32)
+    # Half a cycle ahead, so the ramp crosses zero at the start of each cycle
+    wave = _oscillator_phase(frequency, num_samples, sample_rate, offset=0.5)
+    wave *= 2.0
+    wave -= 1.0
+    return wave
 
 def triangle_wave(frequency, duration, sample_rate=SAMPLE_RATE):
-    if frequency == 0: return np.zeros(int(duration * sample_rate))
-    t = np.linspace(0, duration, int(duration * sample_rate), endpoint=False)
-    wave = 2.0 * np.abs(2.0 * (t * frequency - np.floor(t * frequency + 0.5))) - 1.0
-    return wave.astype(np.float32)
+    num_samples = int(duration * sample_rate)
+    if frequency == 0: return np.zeros(num_samples, dtype=np.float32)
+    wave = _oscillator_phase(frequency, num_samples, sample_rate, offset=0.5)
+    wave *= 2.0
+    wave -= 1.0
+    np.abs(wave, out=wave)
+    wave *= 2.0
+    wave -= 1.0
+    return wave
 
 def noise_wave(duration, noise_type="white", sample_rate=SAMPLE_RATE):
     num_samples = int(duration * sample_rate)
     if noise_type == "white" or noise_type =="pink": # Pink noise simplified to white for now
-        wave = np.random.uniform(-1.0, 1.0, num_samples)
+        # Uniform [-1, 1) drawn straight into float32, no float64 intermediate
+        wave = _noise_rng.random(num_samples, dtype=np.float32)
+        wave *= 2.0
+        wave -= 1.0
     else:
-        wave = np.zeros(num_samples)
-    return wave.astype(np.float32)
+        wave = np.zeros(num_samples, dtype=np.float32)
+    return wave
+
+# Block of white noise generated once; drum hits read random slices of it, see _pooled_noise_wave
+_NOISE_POOL_SAMPLES = 1 << 17 # ~3 s at 44.1 kHz, far longer than any drum hit
+_noise_pool = noise_wave(_NOISE_POOL_SAMPLES, sample_rate=1)
+_noise_pool.flags.writeable = False
+
+def _pooled_noise_wave(duration, noise_type="white", sample_rate=SAMPLE_RATE):
+    """
+    Like noise_wave, but returns a read-only slice of the shared noise pool at a random offset
+    instead of drawing new noise. Hits longer than the pool fall back to noise_wave.
+    """
+    num_samples = int(duration * sample_rate)
+    if num_samples > _NOISE_POOL_SAMPLES or not (noise_type == "white" or noise_type == "pink"):
+        return noise_wave(duration, noise_type, sample_rate)
+    offset = int(_noise_rng.integers(0, _NOISE_POOL_SAMPLES - num_samples + 1))
+    return _noise_pool[offset:offset + num_samples]
+
+# Rendered oscillator waveforms by (waveform, frequency, duty cycle, sample rate), see _cached_oscillator
+_oscillator_cache = {}
+_OSCILLATOR_CACHE_MAX_ENTRIES = 256
+
+def _cached_oscillator(waveform_type, frequency, duty_cycle, num_samples, sample_rate=SAMPLE_RATE):
+    """
+    Returns num_samples of the waveform as a read-only float32 array. Every note's oscillator starts
+    at phase 0, so a shorter note of the same pitch is a prefix of a longer one: the longest rendering
+    per pitch is kept and sliced, instead of regenerating the waveform for every note.
+    """
+    if waveform_type not in ("pulse", "sawtooth", "triangle"):
+        return np.zeros(num_samples, dtype=np.float32)
+    key = (waveform_type, frequency, duty_cycle if waveform_type == "pulse" else None, sample_rate)
+    wave = _oscillator_cache.get(key)
+    if wave is None or len(wave) < num_samples:
+        duration = (num_samples + 0.5) / sample_rate # int(duration * sample_rate) == num_samples despite rounding
+        if waveform_type == "pulse": wave = pulse_wave(frequency, duration, duty_cycle, sample_rate)
+        elif waveform_type == "sawtooth": wave = sawtooth_wave(frequency, duration, sample_rate)
+        else: wave = triangle_wave(frequency, duration, sample_rate)
+        if len(_oscillator_cache) >= _OSCILLATOR_CACHE_MAX_ENTRIES: _oscillator_cache.clear()
+        wave.flags.writeable = False
+        _oscillator_cache[key] = wave
+    return wave[:num_samples]
 
 # --- ADSR Envelope (Identical to previous version) ---
+def _linear_ramp_into(out, start, stop):
+    """Fills out in place with the values of np.linspace(start, stop, len(out)), in float32."""
+    num = len(out)
+    if num == 0: return
+    np.multiply(np.arange(num, dtype=np.float32), np.float32((stop - start) / (num - 1) if num > 1 else 0.0), out=out)
+    out += np.float32(start)
+    if num > 1: out[-1] = stop # linspace includes the endpoint exactly
+
 def adsr_envelope(duration_samples, attack_time, decay_time, sustain_level, release_time, sample_rate=SAMPLE_RATE):
     attack_samples = int(attack_time * sample_rate)
     decay_samples = int(decay_time * sample_rate)
@@ -50,7 +126,7 @@ def adsr_envelope(duration_samples, attack_time, decay_time, sustain_level, rele
     current_level_at_note_end = sustain_level # Default if note is long enough for full sustain phase
     if attack_samples > 0:
         end_attack = min(attack_samples, duration_samples)
-        envelope[:end_attack] = np.linspace(0, 1, end_attack) if end_attack > 0 else []
+        _linear_ramp_into(envelope[:end_attack], 0, 1)
         if duration_samples <= attack_samples: current_level_at_note_end = envelope[duration_samples-1] if duration_samples > 0 else 0
 
     if decay_samples > 0 and duration_samples > attack_samples:
@@ -58,7 +134,7 @@ def adsr_envelope(duration_samples, attack_time, decay_time, sustain_level, rele
         end_decay = min(duration_samples, start_decay + decay_samples)
         decay_actual_samples = end_decay - start_decay
         if decay_actual_samples > 0:
-            envelope[start_decay:end_decay] = np.linspace(1, sustain_level, decay_actual_samples)
+            _linear_ramp_into(envelope[start_decay:end_decay], 1, sustain_level)
         if duration_samples <= (attack_samples + decay_samples) : current_level_at_note_end = envelope[duration_samples-1] if duration_samples > 0 else sustain_level
 
     if sustain_samples > 0:
@@ -72,10 +148,25 @@ def adsr_envelope(duration_samples, attack_time, decay_time, sustain_level, rele
         end_release = duration_samples + release_samples
         # Level at release start depends on where the note_off occurred
         level_at_release_start = current_level_at_note_end
-        envelope[start_release:end_release] = np.linspace(level_at_release_start, 0, release_samples)
+        _linear_ramp_into(envelope[start_release:end_release], level_at_release_start, 0)
 
     return envelope[:duration_samples + release_samples]
 
+def _shared_adsr_envelope(envelope_cache, duration_samples, adsr, sample_rate=SAMPLE_RATE):
+    """
+    adsr_envelope as a read-only array memoized in envelope_cache, a dict owned by one render (or None
+    for no memo). Notes of one instrument mostly have the same few lengths (drum hits all do), so the
+    envelope is built once per length instead of once per note. Lengths are in samples and change with
+    the BPM, so the memo is dropped with the render rather than kept for the life of the process.
+    """
+    if envelope_cache is None: return adsr_envelope(duration_samples, *adsr, sample_rate)
+    envelope_key = (duration_samples, adsr, sample_rate)
+    envelope = envelope_cache.get(envelope_key)
+    if envelope is None:
+        envelope = envelope_cache[envelope_key] = adsr_envelope(duration_samples, *adsr, sample_rate)
+        envelope.flags.writeable = False
+    return envelope
+
 
 # --- Instrument Definitions (Mostly identical, filter_type might be used by EQ now) ---
 INSTRUMENT_PARAMS = {
@@ -90,123 +181,229 @@ INSTRUMENT_PARAMS = {
     "Drums_OpenHat":{"waveform": "noise", "noise_type": "white", "adsr": (0.001, 0.2, 0, 0.1)},
 }
 
+# Drum track notes and the instrument that plays each of them
+DRUM_NOTE_MAP = {60: "Drums_Kick", 61: "Drums_Snare", 62: "Drums_Hat", 63: "Drums_OpenHat"}
 
-def render_midi_event_mono(event, instrument_name_full, bpm, sample_rate=SAMPLE_RATE):
-    """
-    Renders a single MIDIEvent to a MONO audio waveform, applying track level and EQ.
-    instrument_name_full can be "Melody", "Drums_Kick", etc.
-    Returns a tuple: (start_sample_index, mono_audio_data_array)
-    """
-    if event.type != 'note':
-        return None, None
 
+def _instrument_params(instrument_name_full):
     params = INSTRUMENT_PARAMS.get(instrument_name_full)
     if not params: # Fallback for generic track name if specific drum name not found
         params = INSTRUMENT_PARAMS.get(instrument_name_full.split("_")[0] if "_" in instrument_name_full else "Default", INSTRUMENT_PARAMS["Melody"])
+    return params
 
+def _note_gain(velocity, instrument_name_full):
+    """Velocity, base amplitude and track-specific gain (leveling) of a note as one scalar."""
+    normalized_velocity = (velocity / 127.0)
+    track_level = audio_processing.TRACK_LEVELS.get(instrument_name_full, audio_processing.TRACK_LEVELS["Default"])
+    return (normalized_velocity**1.5) * DEFAULT_AMPLITUDE * track_level
 
-    note_duration_seconds = (event.duration / bpm) * 60.0
-    attack_s, decay_s, sustain_l, release_s = params["adsr"]
+def _render_note_dry(note, duration_beats, params, bpm, sample_rate=SAMPLE_RATE, envelope_cache=None):
+    """
+    Renders a note's enveloped waveform (including its release tail) before any gain or EQ.
+    Pass a dict as envelope_cache to share envelopes between the notes of one render (see _shared_adsr_envelope).
+    Returns a new float32 array, None if the note has no pitch.
+    """
+    note_duration_seconds = (duration_beats / bpm) * 60.0
+    release_s = params["adsr"][3]
     total_sounding_duration_seconds = note_duration_seconds + release_s
     total_samples = int(total_sounding_duration_seconds * sample_rate)
-    if total_samples == 0: return int((event.time_start / bpm) * 60.0 * sample_rate), np.array([], dtype=np.float32)
+    if total_samples == 0: return np.array([], dtype=np.float32)
 
     held_duration_samples = int(note_duration_seconds * sample_rate)
-    wave_data = np.zeros(total_samples, dtype=np.float32)
 
     # Generate base waveform
     if "noise" in params["waveform"]:
-        base_wave = noise_wave(total_sounding_duration_seconds, params.get("noise_type", "white"), sample_rate)
+        base_wave = _pooled_noise_wave(total_sounding_duration_seconds, params.get("noise_type", "white"), sample_rate)
     else:
-        frequency = midi_to_frequency(event.note + (params.get("octave_shift", 0) * 12))
-        if frequency == 0: return int((event.time_start / bpm) * 60.0 * sample_rate), np.zeros(0, dtype=np.float32)
-        waveform_type = params["waveform"]
-        if waveform_type == "pulse": base_wave = pulse_wave(frequency, total_sounding_duration_seconds, params.get("duty_cycle", 0.5), sample_rate)
-        elif waveform_type == "sawtooth": base_wave = sawtooth_wave(frequency, total_sounding_duration_seconds, sample_rate)
-        elif waveform_type == "triangle": base_wave = triangle_wave(frequency, total_sounding_duration_seconds, sample_rate)
-        else: base_wave = np.zeros(total_samples)
-
-    env = adsr_envelope(held_duration_samples, attack_s, decay_s, sustain_l, release_s, sample_rate)
-    if len(env) > len(base_wave): env = env[:len(base_wave)]
-    wave_data[:len(env)] = base_wave[:len(env)] * env
-
-    # Apply velocity
-    normalized_velocity = (event.velocity / 127.0)
-    wave_data *= (normalized_velocity**1.5)
-    wave_data *= DEFAULT_AMPLITUDE
-
-    # Apply track-specific gain (leveling)
-    track_level = audio_processing.TRACK_LEVELS.get(instrument_name_full, audio_processing.TRACK_LEVELS["Default"])
-    wave_data *= track_level
+        frequency = midi_to_frequency(note + (params.get("octave_shift", 0) * 12))
+        if frequency == 0: return None
+        base_wave = _cached_oscillator(params["waveform"], frequency, params.get("duty_cycle", 0.5), total_samples, sample_rate)
+
+    env = _shared_adsr_envelope(envelope_cache, held_duration_samples, params["adsr"], sample_rate)
+    env_len = min(len(env), len(base_wave))
+    # Only the part past the envelope (usually nothing) needs zeroing
+    wave_data = np.empty(total_samples, dtype=np.float32)
+    np.multiply(base_wave[:env_len], env[:env_len], out=wave_data[:env_len])
+    wave_data[env_len:] = 0.0
+    return wave_data
+
+def render_midi_event_mono(event, instrument_name_full, bpm, sample_rate=SAMPLE_RATE):
+    """
+    Renders a single MIDIEvent to a MONO audio waveform, applying track level and EQ.
+    instrument_name_full can be "Melody", "Drums_Kick", etc.
+    Returns a tuple: (start_sample_index, mono_audio_data_array)
+    """
+    if event.type != 'note':
+        return None, None
+
+    start_sample_offset = int(event.time_start * ((60.0 / bpm) * sample_rate))
+    note_gain = _note_gain(event.velocity, instrument_name_full)
+    if note_gain < SILENT_NOTE_GAIN: return start_sample_offset, np.zeros(0, dtype=np.float32)
+    wave_data = _render_note_dry(event.note, event.duration, _instrument_params(instrument_name_full), bpm, sample_rate)
+    if wave_data is None: return start_sample_offset, np.zeros(0, dtype=np.float32)
+    wave_data *= note_gain
 
     # Apply track-specific EQ
     # EQ is applied to the mono signal before panning
     wave_data = audio_processing.apply_eq_track(wave_data, instrument_name_full, sample_rate)
 
-    start_sample_offset = int((event.time_start / bpm) * 60.0 * sample_rate)
-    return start_sample_offset, wave_data.astype(np.float32)
+    return start_sample_offset, wave_data.astype(np.float32, copy=False)
+
+
+def _merge_spans(spans):
+    """Merges overlapping (start, end) sample ranges into a sorted list of disjoint ranges."""
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]: merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
 
+def _tracks_end_beats(tracks, bpm):
+    """Returns the beat at which the last event in tracks (including its release tail) stops sounding."""
+    max_event_time_beats = 0
+    for track_name_main, track_events in tracks.items():
+        if track_name_main != "Drums":
+            # One instrument per track, so its release tail only has to be looked up once
+            params = INSTRUMENT_PARAMS.get(track_name_main)
+            if params and track_events:
+                release_time_beats = (params["adsr"][3] * bpm) / 60.0
+                event_end_time_beats = max(event.time_start + event.duration for event in track_events) + release_time_beats
+                if event_end_time_beats > max_event_time_beats:
+                    max_event_time_beats = event_end_time_beats
+            continue
+        # Each drum note has its own instrument (e.g. Drums_Kick), so look the release tails up per note once
+        release_beats_by_note = {note: (INSTRUMENT_PARAMS[instrument_name]["adsr"][3] * bpm) / 60.0
+                                 for note, instrument_name in DRUM_NOTE_MAP.items()}
+        event_end_time_beats = max((event.time_start + event.duration + release_beats_by_note[event.note]
+                                    for event in track_events if event.note in release_beats_by_note), default=0)
+        if event_end_time_beats > max_event_time_beats:
+            max_event_time_beats = event_end_time_beats
+    return max_event_time_beats
+
+
+def _mix_tracks_dry(tracks, bpm, sample_rate, start_sample, num_samples):
+    """
+    Renders the events of tracks ({track_name: [MIDIEvent, ...]}) with leveling, EQ and panning into
+    a new stereo buffer of num_samples frames, where frame 0 is song sample start_sample.
+    The mix is not mastered. Events must not start before start_sample; audio past the end is dropped.
+    """
+    stereo_buffer = np.zeros((num_samples, 2), dtype=np.float32) # Stereo buffer
 
-def render_song_to_stereo_mix(song_data, sample_rate=SAMPLE_RATE):
+    # Group events by full instrument name (e.g. Drums_Kick vs just Drums)
+    events_by_instrument = {}
+    for track_name, track_events in tracks.items():
+        for event in track_events:
+            instrument_name_full = track_name
+            if track_name == "Drums":
+                instrument_name_full = DRUM_NOTE_MAP.get(event.note)
+                if instrument_name_full is None: continue # Skip unknown drum notes
+            events_by_instrument.setdefault(instrument_name_full, []).append(event)
+
+    # Sum each instrument's dry events into its own mono bus, then EQ, pan and mix the buses
+    # per span of sound. EQ is linear, so filtering the summed span matches filtering each
+    # of its events. Buses are EQ'd on worker threads while the next one is being rendered.
+    scratch = np.empty(num_samples, dtype=np.float32) # For scaling a note before it's added to its bus
+    samples_per_beat = (60.0 / bpm) * sample_rate
+    envelope_cache = {} # ADSR envelopes by length, shared by all the buses of this render
+
+    def rendered_tracks():
+        for instrument_name_full, instrument_events in events_by_instrument.items():
+            track_bus = np.zeros(num_samples, dtype=np.float32)
+            event_spans = []
+            params = _instrument_params(instrument_name_full)
+            # Before gain, a note only depends on its pitch and length, so repeated notes are rendered
+            # once and scaled by each one's velocity gain. For drums that means every hit of a drum
+            # (and length) replays the same noise burst, like a sample would.
+            dry_notes = {}
+            for event in instrument_events:
+                if event.type != 'note':
+                    continue
+                note_gain = _note_gain(event.velocity, instrument_name_full)
+                if note_gain < SILENT_NOTE_GAIN:
+                    continue
+                dry_key = (event.note, event.duration)
+                dry_note = dry_notes.get(dry_key)
+                if dry_note is None:
+                    dry_note = dry_notes[dry_key] = _render_note_dry(event.note, event.duration, params, bpm, sample_rate, envelope_cache)
+                if dry_note is None or dry_note.size == 0:
+                    continue
+                offset = int(event.time_start * samples_per_beat) - start_sample
+                available_len = min(len(dry_note), num_samples - offset)
+                if available_len > 0:
+                    scaled = np.multiply(dry_note[:available_len], note_gain, out=scratch[:available_len])
+                    track_bus[offset:offset + available_len] += scaled
+                    event_spans.append((offset, offset + available_len))
+            yield instrument_name_full, track_bus, _merge_spans(event_spans)
+
+    audio_processing.render_mix(rendered_tracks(), sample_rate, stereo_buffer)
+    return stereo_buffer
+
+
+def _split_tracks_by_section(song_data):
+    """
+    Splits the song's events by section (using song_data.section_details), the same way
+    song_generator.regenerate_specific_section assigns events to a section: by start time.
+    Returns a list with one {track_name: [events]} dict per section.
+    """
+    section_starts = [detail['start_beat'] for detail in song_data.section_details]
+    sections = [{track_name: [] for track_name in song_data.tracks} for _ in section_starts]
+    for track_name, track_events in song_data.tracks.items():
+        for event in track_events:
+            # Events before the first section (there shouldn't be any) go to the first one
+            section_index = max(0, bisect.bisect_right(section_starts, event.time_start) - 1)
+            sections[section_index][track_name].append(event)
+    return sections
+
+
+def render_song_to_stereo_mix(song_data, sample_rate=SAMPLE_RATE, section_cache=None):
     """
     Renders a full Song object to a final STEREO audio mix,
     including leveling, EQ, panning, and mastering.
+    Pass a dict as section_cache to render section by section and keep each section's un-mastered
+    mix in it between calls: sections whose events haven't changed (e.g. all but the one just
+    regenerated) are reused instead of re-rendered. The sections are overlap-added, so release tails
+    still ring into the next section, and mastering is applied to the whole song as usual.
     """
     if not song_data: return np.array([[0,0]], dtype=np.float32) # Return stereo silence
-    all_events = song_data.get_all_events()
-    if not all_events: return np.array([[0,0]], dtype=np.float32)
-
-    max_event_time_beats = 0
-    for track_name_main, track_events in song_data.tracks.items():
-        for event in track_events:
-            # Determine full instrument name (e.g. Drums_Kick) for ADSR lookup
-            instr_name_for_adsr = track_name_main
-            if track_name_main == "Drums":
-                if event.note == 60: instr_name_for_adsr = "Drums_Kick"
-                elif event.note == 61: instr_name_for_adsr = "Drums_Snare"
-                elif event.note == 62: instr_name_for_adsr = "Drums_Hat"
-                elif event.note == 63: instr_name_for_adsr = "Drums_OpenHat"
-
-            params = INSTRUMENT_PARAMS.get(instr_name_for_adsr)
-            if params:
-                release_time_beats = (params["adsr"][3] * song_data.bpm) / 60.0
-                event_end_time_beats = event.time_start + event.duration + release_time_beats
-                if event_end_time_beats > max_event_time_beats:
-                    max_event_time_beats = event_end_time_beats
+    if not any(song_data.tracks.values()): return np.array([[0,0]], dtype=np.float32)
 
+    max_event_time_beats = _tracks_end_beats(song_data.tracks, song_data.bpm)
     total_song_duration_seconds = (max_event_time_beats / song_data.bpm) * 60.0 if song_data.bpm > 0 else 0
     total_song_samples = int(total_song_duration_seconds * sample_rate) + sample_rate # Add buffer
 
-    master_stereo_buffer = np.zeros((total_song_samples, 2), dtype=np.float32) # Stereo buffer
-
-    for track_name, track_events in song_data.tracks.items():
-        for event in track_events:
-            # Determine full instrument name for processing (e.g. Drums_Kick vs just Drums)
-            instrument_name_full = track_name
-            if track_name == "Drums":
-                if event.note == 60: instrument_name_full = "Drums_Kick"
-                elif event.note == 61: instrument_name_full = "Drums_Snare"
-                elif event.note == 62: instrument_name_full = "Drums_Hat"
-                elif event.note == 63: instrument_name_full = "Drums_OpenHat"
-                else: continue # Skip unknown drum notes
-
-            start_sample, mono_audio_chunk = render_midi_event_mono(event, instrument_name_full, song_data.bpm, sample_rate)
-
-            if mono_audio_chunk is not None and mono_audio_chunk.size > 0:
-                # Apply panning to the mono chunk to make it stereo
-                pan_value = audio_processing.TRACK_PANNING.get(instrument_name_full, audio_processing.TRACK_PANNING["Default"])
-                stereo_audio_chunk = audio_processing.apply_panning(mono_audio_chunk, pan_value)
-
-                end_sample = start_sample + len(stereo_audio_chunk)
-                if end_sample <= total_song_samples:
-                    master_stereo_buffer[start_sample:end_sample] += stereo_audio_chunk
-                else:
-                    available_len = total_song_samples - start_sample
-                    if available_len > 0:
-                         master_stereo_buffer[start_sample:, :] += stereo_audio_chunk[:available_len, :]
-
-    # Apply mastering chain to the final stereo mix
-    final_mastered_mix = audio_processing.apply_mastering_chain(master_stereo_buffer)
+    if section_cache is None or not song_data.section_details:
+        master_stereo_buffer = _mix_tracks_dry(song_data.tracks, song_data.bpm, sample_rate, 0, total_song_samples)
+    else:
+        master_stereo_buffer = np.zeros((total_song_samples, 2), dtype=np.float32) # Stereo buffer
+        sections = _split_tracks_by_section(song_data)
+        samples_per_beat = (60.0 / song_data.bpm) * sample_rate # Same factor as _mix_tracks_dry, so section starts line up with event starts
+        for section_index, section_tracks in enumerate(sections):
+            section_start_sample = int(song_data.section_details[section_index]['start_beat'] * samples_per_beat)
+            # Key on everything that affects the section's audio; compared exactly, so no hash collisions.
+            # Sorted, since regenerating a section re-sorts every track's events by start time.
+            cache_key = (song_data.bpm, sample_rate, section_start_sample,
+                         tuple(sorted((track_name, e.type, e.note, e.velocity, e.time_start, e.duration)
+                                      for track_name, track_events in section_tracks.items() for e in track_events)))
+            cached = section_cache.get(section_index)
+            if cached is not None and cached[0] == cache_key:
+                section_audio = cached[1]
+            else:
+                section_end_beats = _tracks_end_beats(section_tracks, song_data.bpm)
+                # +2 samples covers the int() rounding of each event's start and length
+                section_end_sample = int(section_end_beats * samples_per_beat) + 2
+                section_audio = _mix_tracks_dry(section_tracks, song_data.bpm, sample_rate, section_start_sample,
+                                                max(0, section_end_sample - section_start_sample))
+                section_cache[section_index] = (cache_key, section_audio)
+            section_len = min(len(section_audio), total_song_samples - section_start_sample)
+            master_stereo_buffer[section_start_sample:section_start_sample + section_len] += section_audio[:section_len]
+        for stale_index in [idx for idx in section_cache if idx >= len(sections)]:
+            del section_cache[stale_index]
+
+    # Apply mastering chain to the final stereo mix (in place, the master buffer isn't reused)
+    final_mastered_mix = audio_processing.apply_mastering_chain_inplace(master_stereo_buffer)
 
     return final_mastered_mix
 